@@ -0,0 +1,252 @@
+"""
+Offline end-to-end benchmark.
+
+Swaps ChatOpenAI for a ScriptedChatModel replaying list -> check -> book
+transcripts, then drives /bots/chat and /bots/stream in-process at a given
+concurrency for each (schedule size, PDF size) scenario. Reports p50/p95/p99
+latency per endpoint and per traced stage, plus requests per second.
+
+    python -m benchmarks.bench_e2e --concurrency 8 --sessions 5 \
+        --schedule-days 30 365 --pdf-pages 0 20 --save-baseline
+    python -m benchmarks.bench_e2e --compare
+"""
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+import tempfile
+from collections import defaultdict
+from datetime import datetime, timedelta
+from typing import Dict, List
+
+import httpx
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_BASELINE = os.path.join(ROOT, "benchmarks", "baseline.json")
+
+
+class MemoryExporter:
+    """Collects finished spans so stage latencies can be summarised."""
+
+    def __init__(self):
+        self.records = []
+
+    def export(self, record: dict):
+        self.records.append(record)
+
+
+def percentile(values: List[float], q: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    idx = min(len(ordered) - 1, max(0, int(round(q / 100.0 * (len(ordered) - 1)))))
+    return ordered[idx]
+
+
+def summarise(samples: List[float]) -> dict:
+    return {
+        "count": len(samples),
+        "p50_ms": round(percentile(samples, 50) * 1000, 2),
+        "p95_ms": round(percentile(samples, 95) * 1000, 2),
+        "p99_ms": round(percentile(samples, 99) * 1000, 2),
+    }
+
+
+def build_script(bot_name: str, session: int, date: str, time_str: str, with_context: bool) -> Dict[str, dict]:
+    """
+    One session's transcript: (optional context question) -> list -> check -> book.
+    Message texts are unique per bot/session so one model serves every worker.
+    """
+    tag = f"[{bot_name}#{session}]"
+    turns = {}
+    if with_context:
+        turns[f"{tag} Who is the doctor?"] = {
+            "calls": [{"name": "context_tool", "arguments": {"bot_name": bot_name, "user_text": "Who is the doctor?"}}],
+            "final": "Dr. Asha Verma is the chief physician.",
+        }
+    turns[f"{tag} Which slots are free on {date}?"] = {
+        "calls": [{"name": "list_free_slots_tool", "arguments": {"date": date}}],
+        "final": "Here are the free slots.",
+    }
+    turns[f"{tag} Is {time_str} on {date} available?"] = {
+        "calls": [{"name": "check_availability_tool", "arguments": {"date": date, "time": time_str}}],
+        "final": f"{time_str} on {date} is available. May I have your name?",
+    }
+    turns[f"{tag} Book {time_str} on {date} for Rahul"] = {
+        "calls": [{"name": "book_appointment_tool", "arguments": {"date": date, "time": time_str, "patient_name": "Rahul"}}],
+        "final": f"Appointment booked for Rahul at {time_str} on {date}.",
+    }
+    return turns
+
+
+async def run_scenario(main, client, model, exporter, args, schedule_days: int, pdf_pages: int) -> dict:
+    from benchmarks.fixtures import make_schedule, schedule_csv_bytes, make_pdf_bytes, slot_times
+
+    exporter.records.clear()
+    processapi = main.processapi
+    processapi._process_text.clear_conversations()
+
+    schedule = make_schedule(schedule_days, args.slots_per_day)
+    schedule_bytes = schedule_csv_bytes(schedule)
+    pdf_bytes = make_pdf_bytes(pdf_pages) if pdf_pages else None
+    times = slot_times(args.slots_per_day)
+    first_day = datetime.now() + timedelta(days=1)
+
+    # One bot per worker: conversation memory is per bot.
+    bots = []
+    ingest_times = []
+    for w in range(args.concurrency):
+        r = await client.post("/bots/create", json={"bot_name": f"bench-{schedule_days}-{pdf_pages}-{w}"})
+        bot_id = r.json()["bot_id"]
+        await client.post("/bots/upload_schedule", data={"bot_name": bot_id},
+                          files={"file": ("schedule.csv", schedule_bytes, "text/csv")})
+        if pdf_bytes:
+            start = time.perf_counter()
+            await client.post("/bots/upload_context_pdf", data={"bot_name": bot_id},
+                              files={"file": ("context.pdf", pdf_bytes, "application/pdf")})
+            ingest_times.append(time.perf_counter() - start)
+        bots.append(bot_id)
+
+    http_latency = defaultdict(list)
+
+    async def worker(w: int, bot_id: str):
+        for s in range(args.sessions):
+            slot = w * args.sessions + s
+            date = (first_day + timedelta(days=slot // len(times) % schedule_days)).strftime("%Y-%m-%d")
+            time_str = times[slot % len(times)]
+            script = build_script(bot_id, s, date, time_str, with_context=bool(pdf_bytes))
+            model.script.update(script)
+            for i, message in enumerate(script):
+                endpoint = "/bots/stream" if args.stream_every and i % args.stream_every == 0 else "/bots/chat"
+                start = time.perf_counter()
+                r = await client.post(endpoint, json={"bot_name": bot_id, "message": message})
+                _ = r.content
+                http_latency[endpoint].append(time.perf_counter() - start)
+                if r.status_code != 200:
+                    http_latency[f"{endpoint} errors"].append(0.0)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker(w, b) for w, b in enumerate(bots)))
+    wall = time.perf_counter() - start
+
+    stages = defaultdict(list)
+    for record in exporter.records:
+        stages[record["name"]].append(record["duration_ms"] / 1000.0)
+
+    total_requests = sum(len(v) for k, v in http_latency.items() if not k.endswith("errors"))
+    return {
+        "schedule_rows": len(schedule),
+        "pdf_pages": pdf_pages,
+        "concurrency": args.concurrency,
+        "requests": total_requests,
+        "errors": sum(len(v) for k, v in http_latency.items() if k.endswith("errors")),
+        "wall_s": round(wall, 3),
+        "rps": round(total_requests / wall, 2) if wall else 0.0,
+        "endpoints": {k: summarise(v) for k, v in http_latency.items() if not k.endswith("errors")},
+        "stages": {k: summarise(v) for k, v in sorted(stages.items())},
+        "ingest": summarise(ingest_times) if ingest_times else None,
+    }
+
+
+def print_report(results: Dict[str, dict]):
+    for name, res in results.items():
+        print(f"\n=== {name}: {res['requests']} requests, {res['rps']} req/s, {res['errors']} errors ===")
+        rows = [("endpoint " + k, v) for k, v in res["endpoints"].items()] + list(res["stages"].items())
+        if res.get("ingest"):
+            rows.append(("ingest (upload_context_pdf)", res["ingest"]))
+        print(f"{'stage':<40}{'count':>8}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+        for label, s in rows:
+            print(f"{label:<40}{s['count']:>8}{s['p50_ms']:>10}{s['p95_ms']:>10}{s['p99_ms']:>10}")
+
+
+def compare(results: Dict[str, dict], baseline: Dict[str, dict], tolerance: float) -> bool:
+    """
+    Print p95/RPS deltas against the baseline. Returns False on regression.
+    """
+    ok = True
+    print("\n=== comparison with baseline ===")
+    for name, res in results.items():
+        base = baseline.get(name)
+        if not base:
+            print(f"{name}: no baseline")
+            continue
+        delta = (res["rps"] - base["rps"]) / base["rps"] * 100 if base["rps"] else 0.0
+        flag = "REGRESSION" if delta < -tolerance else ""
+        ok = ok and not flag
+        print(f"{name}: rps {base['rps']} -> {res['rps']} ({delta:+.1f}%) {flag}")
+        for stage, s in {**res["endpoints"], **res["stages"]}.items():
+            b = base["endpoints"].get(stage) or base["stages"].get(stage)
+            if not b or not b["p95_ms"]:
+                continue
+            d = (s["p95_ms"] - b["p95_ms"]) / b["p95_ms"] * 100
+            flag = "REGRESSION" if d > tolerance else ""
+            ok = ok and not flag
+            print(f"  {stage:<38} p95 {b['p95_ms']:>9} -> {s['p95_ms']:>9} ({d:+.1f}%) {flag}")
+    return ok
+
+
+async def main_async(args) -> Dict[str, dict]:
+    workdir = tempfile.mkdtemp(prefix="appointment-bench-")
+    os.chdir(workdir)
+    sys.path.insert(0, ROOT)
+
+    import main
+    from core.utils.metrics import metrics
+    from benchmarks.fake_llm import ScriptedChatModel, FakeClientPool
+
+    exporter = MemoryExporter()
+    metrics.exporters.append(exporter)
+
+    model = ScriptedChatModel(latency=args.llm_latency)
+    main.processapi._process_text.client_pool = FakeClientPool(model)
+
+    results = {}
+    transport = httpx.ASGITransport(app=main.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+        for days in args.schedule_days:
+            for pages in args.pdf_pages:
+                name = f"schedule={days}d pdf={pages}p c={args.concurrency}"
+                results[name] = await run_scenario(main, client, model, exporter, args, days, pages)
+    print(f"\nworkspace: {workdir}")
+    return results
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Offline end-to-end benchmark with a scripted LLM.")
+    parser.add_argument("--concurrency", type=int, default=4, help="Concurrent workers (one bot each).")
+    parser.add_argument("--sessions", type=int, default=5, help="Scripted sessions per worker.")
+    parser.add_argument("--schedule-days", type=int, nargs="+", default=[30, 365])
+    parser.add_argument("--slots-per-day", type=int, default=16)
+    parser.add_argument("--pdf-pages", type=int, nargs="+", default=[0, 20], help="0 disables the PDF.")
+    parser.add_argument("--stream-every", type=int, default=2, help="Send every Nth turn to /bots/stream (0 = never).")
+    parser.add_argument("--llm-latency", type=float, default=0.0, help="Simulated seconds per LLM call.")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE)
+    parser.add_argument("--save-baseline", action="store_true")
+    parser.add_argument("--compare", action="store_true")
+    parser.add_argument("--tolerance", type=float, default=15.0, help="Allowed regression in percent.")
+    parser.add_argument("--output", help="Write the JSON results here.")
+    return parser.parse_args(argv)
+
+
+if __name__ == '__main__':
+    args = parse_args()
+    args.baseline = os.path.abspath(args.baseline)
+    output = os.path.abspath(args.output) if args.output else None
+
+    results = asyncio.run(main_async(args))
+    print_report(results)
+
+    if output:
+        with open(output, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+    if args.save_baseline:
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+        print(f"\nbaseline saved to {args.baseline}")
+    if args.compare:
+        if not os.path.exists(args.baseline):
+            sys.exit(f"no baseline at {args.baseline}")
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            sys.exit(0 if compare(results, json.load(f), args.tolerance) else 1)
@@ -0,0 +1,156 @@
+"""
+Vector index benchmark.
+
+Builds flat, HNSW and IVF-PQ indexes over the same vectors and reports build
+time, p50/p95 single-query latency, serialized index size and recall@k
+against the exact flat index. Vectors are synthetic clusters with MiniLM's
+dimension (384) so large corpora need no model download.
+
+    python -m benchmarks.bench_index --sizes 2000 20000 100000
+    python -m benchmarks.bench_index --embeddings torch onnx-int8 --texts 512
+
+`--embeddings` additionally times document embedding per backend and reports
+how well each backend's neighbours agree with the torch model's.
+"""
+import os
+import sys
+import json
+import time
+import argparse
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from benchmarks.bench_e2e import percentile  # noqa: E402
+
+
+def synthetic_vectors(num: int, dim: int, clusters: int = 64, seed: int = 0) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(clusters, dim)).astype("float32")
+    labels = rng.integers(0, clusters, size=num)
+    vectors = centers[labels] + 0.35 * rng.normal(size=(num, dim)).astype("float32")
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors.astype("float32")
+
+
+def recall_at_k(truth: np.ndarray, found: np.ndarray, k: int) -> float:
+    hits = sum(len(set(t[:k]) & set(f[:k])) for t, f in zip(truth, found))
+    return hits / float(k * len(truth))
+
+
+def bench_index(vectors: np.ndarray, queries: np.ndarray, index_type: str, k: int, truth: np.ndarray = None) -> dict:
+    import faiss
+    from core.utils.vectordb import build_faiss_index
+
+    start = time.perf_counter()
+    index = build_faiss_index(vectors, index_type)
+    build_s = time.perf_counter() - start
+
+    latencies = []
+    found = []
+    for q in queries:
+        start = time.perf_counter()
+        _, ids = index.search(q.reshape(1, -1), k)
+        latencies.append(time.perf_counter() - start)
+        found.append(ids[0])
+    found = np.asarray(found)
+
+    return {
+        "index_type": index_type,
+        "build_s": round(build_s, 3),
+        "query_p50_ms": round(percentile(latencies, 50) * 1000, 3),
+        "query_p95_ms": round(percentile(latencies, 95) * 1000, 3),
+        "index_mb": round(faiss.serialize_index(index).nbytes / 1e6, 2),
+        f"recall@{k}": round(recall_at_k(truth, found, k), 4) if truth is not None else 1.0,
+    }, found
+
+
+def bench_sizes(args) -> list:
+    rows = []
+    for size in args.sizes:
+        vectors = synthetic_vectors(size, args.dim, seed=size)
+        queries = synthetic_vectors(args.queries, args.dim, seed=size + 1)
+        flat, truth = bench_index(vectors, queries, "flat", args.k)
+        rows.append({"chunks": size, **flat})
+        for index_type in ("hnsw", "ivfpq"):
+            res, _ = bench_index(vectors, queries, index_type, args.k, truth)
+            rows.append({"chunks": size, **res})
+    return rows
+
+
+def sample_texts(num: int, seed: int = 0) -> list:
+    from benchmarks.fixtures import WORDS
+    rng = np.random.default_rng(seed)
+    return [" ".join(rng.choice(WORDS, size=120)) for _ in range(num)]
+
+
+def bench_embeddings(args) -> list:
+    import faiss
+    from core.utils.vectordb import get_embedding_model, resolve_backend
+
+    texts = sample_texts(args.texts)
+    queries = sample_texts(args.queries, seed=1)
+    reference = None
+    rows = []
+    for backend in args.embeddings:
+        model = get_embedding_model(backend)
+        model.embed_documents(texts[:8])  # warm up
+
+        start = time.perf_counter()
+        doc_vectors = np.asarray(model.embed_documents(texts), dtype="float32")
+        embed_s = time.perf_counter() - start
+        query_vectors = np.asarray([model.embed_query(q) for q in queries], dtype="float32")
+
+        index = faiss.IndexFlatL2(doc_vectors.shape[1])
+        index.add(doc_vectors)
+        _, found = index.search(query_vectors, args.k)
+        if reference is None:
+            reference = found
+
+        rows.append({
+            "backend": resolve_backend(backend),
+            "texts": len(texts),
+            "embed_s": round(embed_s, 3),
+            "texts_per_s": round(len(texts) / embed_s, 1) if embed_s else 0.0,
+            f"agreement@{args.k}": round(recall_at_k(reference, found, args.k), 4),
+        })
+    return rows
+
+
+def print_table(rows: list):
+    if not rows:
+        return
+    columns = list(rows[0].keys())
+    print("".join(f"{c:>16}" for c in columns))
+    for row in rows:
+        print("".join(f"{str(row[c]):>16}" for c in columns))
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Compare flat, HNSW and IVF-PQ indexes and embedding backends.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[2000, 20000, 100000], help="Corpus sizes in chunks.")
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--embeddings", nargs="*", default=[], help="Embedding backends to time, e.g. torch onnx-int8.")
+    parser.add_argument("--texts", type=int, default=512, help="Documents to embed per backend.")
+    parser.add_argument("--output", help="Write the JSON results here.")
+    return parser.parse_args(argv)
+
+
+if __name__ == '__main__':
+    args = parse_args()
+    results = {"indexes": bench_sizes(args)}
+    print("\n=== index types ===")
+    print_table(results["indexes"])
+
+    if args.embeddings:
+        results["embeddings"] = bench_embeddings(args)
+        print("\n=== embedding backends ===")
+        print_table(results["embeddings"])
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
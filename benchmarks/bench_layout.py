@@ -0,0 +1,145 @@
+"""
+Bot directory layout benchmark.
+
+Fills a temporary bots_data tree with N bots in the flat and in the sharded
+layout and reports, for each:
+
+  - bulk provisioning throughput (`HandleData.create_bots` in batches);
+  - p50/p95 latency of single creates once the tree is full;
+  - p50/p95 latency of looking up and reading a random bot's meta.json,
+    and of a lookup for a bot that does not exist;
+  - time to list the top-level directory and to enumerate every bot.
+
+    python -m benchmarks.bench_layout --bots 100000
+"""
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import argparse
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from benchmarks.bench_e2e import summarise  # noqa: E402
+from core.utils.handle_data import HandleData, SCHEDULE_COLUMNS  # noqa: E402
+
+
+def meta_for(bot_id: str) -> dict:
+    return {"greeting": "Hello", "bot_name": bot_id, "bot_id": bot_id, "api_key": None}
+
+
+def bench_layout(layout: str, args) -> dict:
+    workdir = tempfile.mkdtemp(prefix=f"bench-layout-{layout}-")
+    handle_data = HandleData(os.path.join(workdir, "bots_data"), os.path.join(workdir, "vector_store"))
+    handle_data.write_layout(layout)
+
+    bot_ids = [f"clinic-{i}-{random.getrandbits(32):08x}" for i in range(args.bots)]
+    bulk_ids, single_ids = bot_ids[:-args.singles], bot_ids[-args.singles:]
+
+    start = time.perf_counter()
+    for i in range(0, len(bulk_ids), args.batch_size):
+        handle_data.create_bots({b: meta_for(b) for b in bulk_ids[i:i + args.batch_size]})
+    bulk_s = time.perf_counter() - start
+
+    singles = []
+    for bot_id in single_ids:
+        start = time.perf_counter()
+        handle_data.savejson(bot_id, meta_for(bot_id))
+        singles.append(time.perf_counter() - start)
+
+    lookups = []
+    for bot_id in random.sample(bot_ids, min(args.lookups, len(bot_ids))):
+        start = time.perf_counter()
+        with open(handle_data.get_meta_path(bot_id), "r", encoding="utf-8") as f:
+            json.load(f)
+        lookups.append(time.perf_counter() - start)
+
+    misses = []
+    for i in range(args.lookups):
+        start = time.perf_counter()
+        handle_data.bot_exists(f"missing-{i}")
+        misses.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    top_level = len(os.listdir(handle_data.BASE_DIR))
+    listdir_s = time.perf_counter() - start
+
+    start = time.perf_counter()
+    total = sum(1 for _ in handle_data.iter_bots())
+    iter_s = time.perf_counter() - start
+
+    if not args.keep:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    return {
+        "layout": layout,
+        "bots": total,
+        "bulk_bots_per_s": round(len(bulk_ids) / bulk_s, 1) if bulk_s else 0.0,
+        "single_create": summarise(singles),
+        "lookup_meta": summarise(lookups),
+        "lookup_missing": summarise(misses),
+        "top_level_entries": top_level,
+        "listdir_ms": round(listdir_s * 1000, 2),
+        "iter_bots_s": round(iter_s, 3),
+    }
+
+
+def bench_empty_schedule(count: int = 1000) -> dict:
+    """
+    Cost of writing the empty schedule.csv with pandas (before) and as a plain header (now).
+    """
+    import pandas as pd
+
+    workdir = tempfile.mkdtemp(prefix="bench-schedule-")
+    path = os.path.join(workdir, "schedule.csv")
+    start = time.perf_counter()
+    for _ in range(count):
+        pd.DataFrame(columns=SCHEDULE_COLUMNS).to_csv(path, index=False)
+    pandas_s = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for _ in range(count):
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(",".join(SCHEDULE_COLUMNS) + "\n")
+    plain_s = time.perf_counter() - start
+    shutil.rmtree(workdir, ignore_errors=True)
+
+    return {"pandas_ms": round(pandas_s / count * 1000, 3), "plain_ms": round(plain_s / count * 1000, 3)}
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Compare flat and sharded bot directory layouts.")
+    parser.add_argument("--bots", type=int, default=100000)
+    parser.add_argument("--batch-size", type=int, default=1000, help="Bots per create_bots call.")
+    parser.add_argument("--singles", type=int, default=1000, help="Single creates timed once the tree is full.")
+    parser.add_argument("--lookups", type=int, default=2000)
+    parser.add_argument("--layouts", nargs="+", default=["flat", "sharded"])
+    parser.add_argument("--keep", action="store_true", help="Keep the generated trees.")
+    parser.add_argument("--output", help="Write the JSON results here.")
+    return parser.parse_args(argv)
+
+
+if __name__ == '__main__':
+    args = parse_args()
+    args.singles = min(args.singles, args.bots)
+    results = {"layouts": [bench_layout(layout, args) for layout in args.layouts]}
+    results["empty_schedule"] = bench_empty_schedule()
+
+    for res in results["layouts"]:
+        print(f"\n=== {res['layout']}: {res['bots']} bots ===")
+        print(f"bulk create          {res['bulk_bots_per_s']} bots/s")
+        for label in ("single_create", "lookup_meta", "lookup_missing"):
+            s = res[label]
+            print(f"{label:<20} p50 {s['p50_ms']} ms  p95 {s['p95_ms']} ms  p99 {s['p99_ms']} ms")
+        print(f"top-level listdir    {res['listdir_ms']} ms ({res['top_level_entries']} entries)")
+        print(f"enumerate all bots   {res['iter_bots_s']} s")
+    print(f"\nempty schedule.csv: pandas {results['empty_schedule']['pandas_ms']} ms, "
+          f"plain {results['empty_schedule']['plain_ms']} ms")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
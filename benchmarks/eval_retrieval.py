@@ -0,0 +1,210 @@
+"""
+Offline retrieval evaluation.
+
+Indexes one or more PDFs with every (chunk size, overlap) combination and
+runs a question/answer set through the hybrid retriever for every (top-k,
+fusion weight) combination. A retrieved chunk counts as relevant when it
+contains the expected answer text. Reports hit@1 (what `context_tool`
+passes to the agent), recall@k, MRR, index size and query latency.
+
+    python -m benchmarks.eval_retrieval --pdf brochure.pdf --qa qa.json \
+        --chunk-sizes 400 800 1200 --overlaps 0 100 --top-k 1 3 5 --weights 0.3 0.5 0.7
+
+The QA set is a JSON list (or JSONL) of {"question": ..., "answer": ...};
+"answers": [...] lists alternatives. `--weights` is the vector weight, BM25
+gets the rest. With `--bot NAME --apply` the best configuration is written to
+the `retrieval` block of the bot's meta.json (run from the server's working
+directory); `--reindex` then rebuilds the bot's documents with it.
+"""
+import os
+import re
+import sys
+import json
+import time
+import pickle
+import argparse
+import itertools
+from typing import List
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from benchmarks.bench_e2e import percentile  # noqa: E402
+
+
+def load_qa(path: str) -> List[dict]:
+    with open(path, "r", encoding="utf-8") as f:
+        text = f.read()
+    if path.endswith(".jsonl"):
+        items = [json.loads(line) for line in text.splitlines() if line.strip()]
+    else:
+        items = json.loads(text)
+
+    qa = []
+    for item in items:
+        answers = item.get("answers") or [item["answer"]]
+        qa.append({"question": item["question"], "answers": [normalize(a) for a in answers]})
+    return qa
+
+
+def normalize(text: str) -> str:
+    return re.sub(r"\s+", " ", text).strip().lower()
+
+
+def is_relevant(chunk: str, answers: List[str]) -> bool:
+    chunk = normalize(chunk)
+    return any(a in chunk for a in answers)
+
+
+def build_indexes(pdfs: List[str], chunk_size: int, chunk_overlap: int, args):
+    """
+    Chunk, embed and index the PDFs once per chunking configuration.
+    """
+    import faiss
+    from core.utils.knowledge import IncrementalBM25Retriever
+    from core.utils.vectordb import PDFIndexer
+
+    indexer = PDFIndexer(
+        index_type=args.index_type,
+        embedding_backend=args.embedding_backend,
+        chunk_size=chunk_size,
+        chunk_overlap=chunk_overlap,
+    )
+    chunks = []
+    for pdf in pdfs:
+        indexer.pdf_path = pdf
+        chunks.extend(indexer.extract_pdf_text(split=True))
+
+    start = time.perf_counter()
+    store, index_type = indexer.build_vector_store(chunks)
+    # The same BM25 as `KnowledgeBase.search`, so tuned weights carry over
+    bm25 = IncrementalBM25Retriever()
+    bm25.add([str(i) for i in range(len(chunks))], chunks)
+    build_s = time.perf_counter() - start
+
+    size = faiss.serialize_index(store.index).nbytes + len(pickle.dumps(bm25))
+    return store, bm25, chunks, {"index_type": index_type, "build_s": round(build_s, 3), "index_kb": round(size / 1024, 1)}
+
+
+def evaluate(store, bm25, qa: List[dict], top_k: int, vector_weight: float) -> dict:
+    from langchain.retrievers import EnsembleRetriever
+
+    bm25.k = top_k
+    retriever = EnsembleRetriever(
+        retrievers=[store.as_retriever(search_kwargs={"k": top_k}), bm25],
+        weights=[vector_weight, 1 - vector_weight],
+    )
+
+    latencies, ranks = [], []
+    for item in qa:
+        start = time.perf_counter()
+        results = retriever.invoke(item["question"])[:top_k]
+        latencies.append(time.perf_counter() - start)
+        rank = next((i + 1 for i, doc in enumerate(results) if is_relevant(doc.page_content, item["answers"])), None)
+        ranks.append(rank)
+
+    n = float(len(qa))
+    return {
+        "hit@1": round(sum(1 for r in ranks if r == 1) / n, 4),
+        "recall@k": round(sum(1 for r in ranks if r) / n, 4),
+        "mrr": round(sum(1.0 / r for r in ranks if r) / n, 4),
+        "p50_ms": round(percentile(latencies, 50) * 1000, 2),
+        "p95_ms": round(percentile(latencies, 95) * 1000, 2),
+    }
+
+
+def sweep(args) -> List[dict]:
+    qa = load_qa(args.qa)
+    rows = []
+    for chunk_size, chunk_overlap in itertools.product(args.chunk_sizes, args.overlaps):
+        if chunk_overlap >= chunk_size:
+            continue
+        store, bm25, chunks, build = build_indexes(args.pdf, chunk_size, chunk_overlap, args)
+        # Answers split across chunk boundaries cannot be retrieved at any k
+        answerable = sum(1 for item in qa if any(is_relevant(c.page_content, item["answers"]) for c in chunks))
+        for top_k, weight in itertools.product(args.top_k, args.weights):
+            rows.append({
+                "chunk_size": chunk_size,
+                "chunk_overlap": chunk_overlap,
+                "top_k": top_k,
+                "weights": [weight, round(1 - weight, 4)],
+                "chunks": len(chunks),
+                "answerable": round(answerable / float(len(qa)), 4),
+                **build,
+                **evaluate(store, bm25, qa, top_k, weight),
+            })
+    return rows
+
+
+def best(rows: List[dict], objective: str) -> dict:
+    """
+    Highest objective, then hit@1, then lowest p95 latency, then smallest index.
+    """
+    return max(rows, key=lambda r: (r[objective], r["hit@1"], -r["p95_ms"], -r["index_kb"]))
+
+
+def print_table(rows: List[dict]):
+    columns = ["chunk_size", "chunk_overlap", "top_k", "weights", "chunks", "answerable",
+               "index_kb", "hit@1", "recall@k", "mrr", "p50_ms", "p95_ms"]
+    print("".join(f"{c:>14}" for c in columns))
+    for row in rows:
+        print("".join(f"{str(row[c]):>14}" for c in columns))
+
+
+def apply_to_bot(bot_name: str, choice: dict, reindex: bool):
+    from core import ProcessApi
+
+    processapi = ProcessApi()
+    meta_path = processapi._handle_data.get_meta_path(bot_name)
+    if not os.path.exists(meta_path):
+        sys.exit(f"bot '{bot_name}' not found at {meta_path}")
+
+    with open(meta_path, "r", encoding="utf-8") as f:
+        meta = json.load(f)
+    meta["retrieval"] = {
+        **(meta.get("retrieval") or {}),
+        **{k: choice[k] for k in ("chunk_size", "chunk_overlap", "top_k", "weights")},
+    }
+    with open(meta_path, "w", encoding="utf-8") as f:
+        json.dump(meta, f, indent=2)
+    print(f"\nwrote retrieval settings to {meta_path}")
+
+    if reindex:
+        documents = processapi.reindex_documents(bot_name, meta)
+        print(f"re-indexed {len(documents)} documents")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Sweep chunking and fusion settings against a QA set.")
+    parser.add_argument("--pdf", nargs="+", required=True)
+    parser.add_argument("--qa", required=True, help="JSON or JSONL question/answer set.")
+    parser.add_argument("--chunk-sizes", type=int, nargs="+", default=[400, 800, 1200])
+    parser.add_argument("--overlaps", type=int, nargs="+", default=[0, 100, 200])
+    parser.add_argument("--top-k", type=int, nargs="+", default=[1, 3, 5])
+    parser.add_argument("--weights", type=float, nargs="+", default=[0.3, 0.5, 0.7], help="Vector weights; BM25 gets 1 - w.")
+    parser.add_argument("--index-type", default="flat")
+    parser.add_argument("--embedding-backend", default="torch")
+    parser.add_argument("--objective", choices=["mrr", "recall@k", "hit@1"], default="mrr")
+    parser.add_argument("--bot", help="Bot whose meta.json receives the best configuration.")
+    parser.add_argument("--apply", action="store_true", help="Write the best configuration to --bot.")
+    parser.add_argument("--reindex", action="store_true", help="Rebuild --bot's documents after --apply.")
+    parser.add_argument("--output", help="Write all results as JSON here.")
+    return parser.parse_args(argv)
+
+
+if __name__ == '__main__':
+    args = parse_args()
+    rows = sweep(args)
+    print_table(rows)
+
+    choice = best(rows, args.objective)
+    print(f"\nbest by {args.objective}: chunk_size={choice['chunk_size']} chunk_overlap={choice['chunk_overlap']} "
+          f"top_k={choice['top_k']} weights={choice['weights']}")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({"results": rows, "best": choice}, f, indent=2)
+    if args.apply:
+        if not args.bot:
+            sys.exit("--apply needs --bot")
+        apply_to_bot(args.bot, choice, args.reindex)
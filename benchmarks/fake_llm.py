@@ -0,0 +1,87 @@
+import json
+import time
+from typing import Any, Dict, List, Optional
+
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, BaseMessage, FunctionMessage, HumanMessage, ToolMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+
+
+class ScriptedChatModel(BaseChatModel):
+    """
+    Deterministic stand-in for ChatOpenAI that replays function-calling
+    transcripts.
+
+    `script` maps a user message to the tool calls the model should make for
+    it, followed by the final answer:
+
+        {"book 2026-10-21 10:00 AM for Rahul": {
+            "calls": [{"name": "book_appointment_tool", "arguments": {...}}],
+            "final": "Booked."}}
+
+    The step is derived from the number of function results after the last
+    user message, so one instance can serve many conversations concurrently.
+    """
+
+    script: Dict[str, Dict[str, Any]] = {}
+    latency: float = 0.0
+    model_name: str = "scripted"
+
+    @property
+    def _llm_type(self) -> str:
+        return "scripted-chat"
+
+    def _generate(
+            self,
+            messages: List[BaseMessage],
+            stop: Optional[List[str]] = None,
+            run_manager=None,
+            **kwargs: Any) -> ChatResult:
+        if self.latency:
+            time.sleep(self.latency)
+
+        last_human = max(i for i, m in enumerate(messages) if isinstance(m, HumanMessage))
+        user_text = messages[last_human].content
+        step = sum(isinstance(m, (FunctionMessage, ToolMessage)) for m in messages[last_human + 1:])
+
+        turn = self.script.get(user_text, {"calls": [], "final": "Sorry, I did not understand."})
+        if step < len(turn["calls"]):
+            call = turn["calls"][step]
+            message = AIMessage(
+                content="",
+                additional_kwargs={
+                    "function_call": {"name": call["name"], "arguments": json.dumps(call["arguments"])}
+                },
+            )
+        else:
+            message = AIMessage(content=turn["final"])
+
+        prompt_chars = sum(len(str(m.content)) for m in messages)
+        usage = {
+            "prompt_tokens": prompt_chars // 4,
+            "completion_tokens": len(message.content) // 4 + 8,
+        }
+        usage["total_tokens"] = usage["prompt_tokens"] + usage["completion_tokens"]
+        return ChatResult(
+            generations=[ChatGeneration(message=message)],
+            llm_output={"token_usage": usage, "model_name": self.model_name},
+        )
+
+
+class FakeClientPool:
+    """
+    Drop-in replacement for `LLMClientPool` that hands out one ScriptedChatModel.
+    """
+
+    def __init__(self, model: ScriptedChatModel):
+        self.model = model
+
+    def get(self, api_key: Optional[str], model: str = "gpt-4", temperature: float = 0, **kwargs):
+        return self.model
+
+    def close(self):
+        pass
+
+
+if __name__ == '__main__':
+    print('done')
@@ -0,0 +1,89 @@
+import io
+import random
+from datetime import datetime, timedelta
+from typing import List
+
+import pandas as pd
+
+
+WORDS = (
+    "clinic doctor appointment patient consultation hours fees insurance parking "
+    "pediatrics cardiology dermatology orthopedics vaccination follow-up report "
+    "emergency pharmacy reception weekday weekend morning evening procedure"
+).split()
+
+
+def slot_times(slots_per_day: int, start_hour: int = 9, minutes: int = 30) -> List[str]:
+    base = datetime(2000, 1, 1, start_hour)
+    return [(base + timedelta(minutes=minutes * i)).strftime("%I:%M %p") for i in range(slots_per_day)]
+
+
+def make_schedule(days: int, slots_per_day: int = 16, start: datetime = None) -> pd.DataFrame:
+    """
+    Free schedule starting tomorrow, `days` x `slots_per_day` rows.
+    """
+    start = start or datetime.now() + timedelta(days=1)
+    times = slot_times(slots_per_day)
+    rows = [
+        {"date": (start + timedelta(days=d)).strftime("%Y-%m-%d"), "time": t, "is_booked": False, "patient_name": ""}
+        for d in range(days)
+        for t in times
+    ]
+    return pd.DataFrame(rows, columns=["date", "time", "is_booked", "patient_name"])
+
+
+def schedule_csv_bytes(df: pd.DataFrame) -> bytes:
+    buf = io.StringIO()
+    df.to_csv(buf, index=False)
+    return buf.getvalue().encode("utf-8")
+
+
+def _pdf_escape(text: str) -> str:
+    return text.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+
+def make_pdf_bytes(pages: int, lines_per_page: int = 45, seed: int = 7) -> bytes:
+    """
+    Minimal text-only PDF (Helvetica, one content stream per page) that
+    PyPDFLoader can extract. The first page names the doctor and address so
+    `context_tool` has a known answer.
+    """
+    rng = random.Random(seed)
+    page_texts = []
+    for p in range(pages):
+        lines = []
+        if p == 0:
+            lines += ["Dr. Asha Verma is the chief physician.", "The clinic is at 12 MG Road, Pune."]
+        while len(lines) < lines_per_page:
+            lines.append(" ".join(rng.choice(WORDS) for _ in range(12)) + ".")
+        page_texts.append(lines)
+
+    objects = []
+    objects.append("<< /Type /Catalog /Pages 2 0 R >>")
+    kids = " ".join(f"{4 + 2 * i} 0 R" for i in range(pages))
+    objects.append(f"<< /Type /Pages /Kids [{kids}] /Count {pages} >>")
+    objects.append("<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>")
+    for i, lines in enumerate(page_texts):
+        body = "BT /F1 10 Tf 14 TL 40 800 Td " + " ".join(f"({_pdf_escape(l)}) Tj T*" for l in lines) + " ET"
+        objects.append(
+            f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 842] "
+            f"/Resources << /Font << /F1 3 0 R >> >> /Contents {5 + 2 * i} 0 R >>"
+        )
+        objects.append(f"<< /Length {len(body.encode('latin-1'))} >>\nstream\n{body}\nendstream")
+
+    out = io.BytesIO()
+    out.write(b"%PDF-1.4\n")
+    offsets = []
+    for number, obj in enumerate(objects, start=1):
+        offsets.append(out.tell())
+        out.write(f"{number} 0 obj\n{obj}\nendobj\n".encode("latin-1"))
+    xref = out.tell()
+    out.write(f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n".encode("latin-1"))
+    for offset in offsets:
+        out.write(f"{offset:010d} 00000 n \n".encode("latin-1"))
+    out.write(f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n".encode("latin-1"))
+    return out.getvalue()
+
+
+if __name__ == '__main__':
+    print('done')
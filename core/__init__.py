@@ -1,92 +1,90 @@
 from core.utils.handle_data import * 
 from core.oai.llm import *
+from core.oai.router import *
+from core.oai.prompt import *
 from core.utils.vectordb import *
-
-VECTOR_ROOT = "vector_store" 
-
-
-BASE_SYSTEM_PROMPT = """
-You are an appointment scheduling assistant. Your job is to help users book, check, or view appointment slots using tools. Never make assumptions. Always collect required inputs and call tools with the correct parameters.
-
----
-
-TOOL USAGE RULES:
-
-- Use `get_datetime_tool` to convert vague phrases (e.g. "tomorrow at 9") into exact datetime.
-- Use `check_availability_tool` only if both `date` and `time` are known.
-- Use `book_appointment_tool` only if `date`, `time`, and `patient_name` are confirmed.
-- Use `list_free_slots_tool` if the user wants to view open slots for a specific date.
-- Use `context_tool` to answer questions like doctor name, clinic location, hours, etc.
-- Use `reschedule_appointment_tool` for any rescheduling or cancellation request (not supported).
-- Use `escalate_to_human_tool` if:
-  - The request is vague or unsupported
-  - Tools fail multiple times
-  - The user asks for human help
-
-Do not answer these requests directly — always use the corresponding tool to fetch and return results.
-
----
-
-FEW-SHOT EXAMPLES:
-
-User: Can you book 9 AM?  
-Assistant: I’ll need the date and your name to proceed.
-
-User: Book tomorrow at 9 for Rahul.  
-Assistant: Converting "tomorrow at 9" using `get_datetime_tool`...  
-→ Then call `book_appointment_tool`.
-
-User: I need to cancel.  
-Assistant: Cancellation isn’t supported.  
-→ Call `reschedule_appointment_tool`.
-
-User: Who is the doctor?  
-→ Call `context_tool`.
-
-User: I’m confused. Book any time next week.  
-→ Call `escalate_to_human_tool` with reason: unclear scheduling request.
-
----
-
-BEHAVIORAL RULES:
-
-- Never guess missing inputs — ask clearly.
-- Use step-by-step logic: collect → convert → check → book.
-- Always rely on tools — do not answer with memory alone.
-- Do not repeat tool results — just return them clearly.
-
-Use tools to act, ask questions to clarify, and escalate only when necessary.
-"""
-
-
-
+from core.utils.knowledge import *
+from core.utils.metrics import *
+from core.utils.holds import *
+from core.utils.availability import *
+from core.utils.idempotency import *
+from core.utils.admission import *
 
 class ProcessApi:
 
-    def __init__(self  , vector_root = VECTOR_ROOT):
-        self._handle_data = HandleData()
-        self._process_text = ProcessInputText()
-        self.vector_root = vector_root
-        self._create_index = PDFIndexer()
+    def __init__(self  , vector_root = None):
+        self._handle_data = HandleData(vector_root=vector_root)
+        self._process_text = ProcessInputText(handle_data=self._handle_data)
+        self.vector_root = self._handle_data.VECTOR_ROOT
         os.makedirs(self.vector_root, exist_ok=True)
 
+    def index_dir(self, folder_name: str) -> str:
+        return self._handle_data.get_index_dir(folder_name)
+
+    def knowledge_base(self, folder_name: str, config: dict = None) -> KnowledgeBase:
+        settings = bot_retrieval_settings(config) if config is not None else None
+        return get_knowledge_base(self.index_dir(folder_name), settings)
+
     def create_bot(
             self,
             folder_name: str,
             pdf_path : str, 
-            split: bool = True):
+            split: bool = True,
+            config: dict = None):
 
 
-            index_dir = os.path.join(self.vector_root, folder_name)  
+            index_dir = self.index_dir(folder_name)
 
-            self._create_index.set_path(pdf_path=pdf_path, index_dir=index_dir)
-            self._create_index.build_and_save_indexes(split=split)
+            with open(pdf_path, "rb") as f:
+                doc_id = document_id(f.read())
+            document = self.knowledge_base(folder_name, config).add_document(
+                doc_id, os.path.basename(pdf_path), pdf_path, split=split
+            )
 
             
             return {
                 "folder_name": folder_name,
                 "index_dir": index_dir,
+                "document": document,
             }
 
+    def add_document(self, folder_name: str, filename: str, data: bytes, config: dict = None, split: bool = True) -> dict:
+        """
+        Store an uploaded PDF under the bot's documents folder and index it.
+        """
+        doc_id = document_id(data)
+        folder = self._handle_data.get_documents_folder(folder_name)
+        os.makedirs(folder, exist_ok=True)
+        pdf_path = os.path.join(folder, f"{doc_id}.pdf")
+        with open(pdf_path, "wb") as f:
+            f.write(data)
+
+        return self.knowledge_base(folder_name, config).add_document(doc_id, filename, pdf_path, split=split)
+
+    def reindex_documents(self, folder_name: str, config: dict = None) -> list:
+        """
+        Re-chunk and re-embed every stored document, e.g. after the bot's
+        chunking settings changed.
+        """
+        kb = self.knowledge_base(folder_name, config)
+        pdf_paths = {}
+        for doc in kb.list_documents():
+            pdf_path = os.path.join(self._handle_data.get_documents_folder(folder_name), f"{doc['doc_id']}.pdf")
+            if doc["doc_id"] == "context":
+                pdf_path = os.path.join(self._handle_data.get_bot_folder(folder_name), "context.pdf")
+            if os.path.exists(pdf_path):
+                pdf_paths[doc["doc_id"]] = pdf_path
+        return kb.reindex(pdf_paths)
+
+    def list_documents(self, folder_name: str) -> list:
+        return self.knowledge_base(folder_name).list_documents()
+
+    def delete_document(self, folder_name: str, doc_id: str):
+        self.knowledge_base(folder_name).delete_document(doc_id)
+
+        pdf_path = os.path.join(self._handle_data.get_documents_folder(folder_name), f"{doc_id}.pdf")
+        if os.path.exists(pdf_path):
+            os.remove(pdf_path)
+
 if __name__ == '__main__':
     print('done')
\ No newline at end of file
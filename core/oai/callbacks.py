@@ -0,0 +1,135 @@
+import threading
+from typing import Any, Callable, Dict
+from uuid import UUID
+
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.outputs import LLMResult
+
+from core.utils.metrics import metrics
+
+
+class TracingCallbackHandler(BaseCallbackHandler):
+    """
+    LangChain callback handler that records one span per LLM call and per
+    tool invocation, plus token usage counters, into the metrics registry.
+    """
+
+    def __init__(self, bot_name: str):
+        self.bot_name = bot_name
+        self.llm_calls = 0
+        self.cached_tokens = 0  # prompt tokens served from the provider's prefix cache
+        self.tools_run = []  # names of tools that completed, in order
+        self._spans: Dict[UUID, Any] = {}
+
+    # ---------- LLM ----------
+    def on_chat_model_start(self, serialized, messages, *, run_id: UUID, **kwargs):
+        params = kwargs.get("invocation_params") or {}
+        model = params.get("model_name") or params.get("model") or "unknown"
+        self._spans[run_id] = metrics.start_span("llm", bot=self.bot_name, model=model)
+
+    def on_llm_start(self, serialized, prompts, *, run_id: UUID, **kwargs):
+        params = kwargs.get("invocation_params") or {}
+        model = params.get("model_name") or params.get("model") or "unknown"
+        self._spans[run_id] = metrics.start_span("llm", bot=self.bot_name, model=model)
+
+    def on_llm_end(self, response: LLMResult, *, run_id: UUID, **kwargs):
+        span = self._spans.pop(run_id, None)
+        self.llm_calls += 1
+        llm_output = response.llm_output or {}
+        usage = llm_output.get("token_usage") or {}
+        model = llm_output.get("model_name") or (span.attributes.get("model") if span else "unknown")
+
+        prompt_tokens = usage.get("prompt_tokens", 0) or 0
+        completion_tokens = usage.get("completion_tokens", 0) or 0
+        cached_tokens = (usage.get("prompt_tokens_details") or {}).get("cached_tokens", 0) or 0
+        self.cached_tokens += cached_tokens
+        metrics.inc("llm_calls_total", model=model)
+        metrics.inc("llm_tokens_total", prompt_tokens, model=model, kind="prompt")
+        metrics.inc("llm_tokens_total", completion_tokens, model=model, kind="completion")
+        metrics.inc("llm_tokens_total", cached_tokens, model=model, kind="cached_prompt")
+
+        if span is not None:
+            span.set(
+                model=model,
+                prompt_tokens=prompt_tokens,
+                completion_tokens=completion_tokens,
+                cached_tokens=cached_tokens,
+            )
+            span.end()
+
+    def on_llm_error(self, error: BaseException, *, run_id: UUID, **kwargs):
+        span = self._spans.pop(run_id, None)
+        metrics.inc("llm_errors_total", error=type(error).__name__)
+        if span is not None:
+            span.end(error=error)
+
+    # ---------- tools ----------
+    def on_tool_start(self, serialized, input_str: str, *, run_id: UUID, **kwargs):
+        name = (serialized or {}).get("name") or kwargs.get("name") or "unknown"
+        self._spans[run_id] = metrics.start_span(f"tool:{name}", bot=self.bot_name)
+
+    def on_tool_end(self, output, *, run_id: UUID, **kwargs):
+        span = self._spans.pop(run_id, None)
+        if span is not None:
+            name = span.name.split(":", 1)[1]
+            self.tools_run.append(name)
+            metrics.inc("tool_calls_total", tool=name)
+            span.end()
+
+    def on_tool_error(self, error: BaseException, *, run_id: UUID, **kwargs):
+        span = self._spans.pop(run_id, None)
+        if span is not None:
+            metrics.inc("tool_errors_total", tool=span.name.split(":", 1)[1])
+            span.end(error=error)
+
+
+class TurnCancelled(Exception):
+    """Raised inside an agent run when the client cancelled the turn."""
+
+
+class EventStreamCallbackHandler(BaseCallbackHandler):
+    """
+    Forwards LLM tokens and tool start/end events to `emit` (e.g. a WebSocket
+    sender) and aborts the run at the next callback once `cancel` is set.
+    Cancellation is cooperative: an in-flight HTTP call to the provider
+    finishes, but no further tokens are sent and no further tools run.
+    """
+
+    raise_error = True
+
+    def __init__(self, emit: Callable[[dict], None], cancel: threading.Event):
+        self.emit = emit
+        self.cancel = cancel
+        self._tools: Dict[UUID, str] = {}
+
+    def _check_cancelled(self):
+        if self.cancel.is_set():
+            raise TurnCancelled("Turn cancelled by client.")
+
+    def on_chat_model_start(self, serialized, messages, *, run_id: UUID, **kwargs):
+        self._check_cancelled()
+
+    def on_llm_new_token(self, token: str, *, run_id: UUID, **kwargs):
+        self._check_cancelled()
+        if token:
+            self.emit({"type": "token", "token": token})
+
+    def on_tool_start(self, serialized, input_str: str, *, run_id: UUID, **kwargs):
+        self._check_cancelled()
+        name = (serialized or {}).get("name") or kwargs.get("name") or "unknown"
+        self._tools[run_id] = name
+        self.emit({"type": "tool_start", "tool": name, "tool_input": input_str})
+
+    def on_tool_end(self, output, *, run_id: UUID, **kwargs):
+        name = self._tools.pop(run_id, "unknown")
+        self.emit({"type": "tool_end", "tool": name, "observation": str(output)})
+        self._check_cancelled()
+
+    def on_custom_event(self, name: str, data: Any, *, run_id: UUID, **kwargs):
+        if name == "escalated":
+            # The turn is replayed on the strong tier; earlier events are void
+            self.emit({"type": "escalated", "discard_previous_steps": True, **data})
+
+
+if __name__ == '__main__':
+    print('done')
@@ -0,0 +1,288 @@
+import os
+import time
+import asyncio
+import hashlib
+import threading
+from typing import Dict, Optional, Tuple
+
+import httpx
+from langchain_core.rate_limiters import BaseRateLimiter
+from langchain_openai import ChatOpenAI
+
+from core.utils.metrics import metrics
+from core.utils.logger import get_logger
+
+logger = get_logger("client_pool")
+
+
+def key_id(api_key: Optional[str]) -> str:
+    """
+    Short, non-reversible label for an API key (safe for logs and metrics).
+    """
+    if not api_key:
+        return "none"
+    return hashlib.sha256(api_key.encode("utf-8")).hexdigest()[:8]
+
+
+class RateLimitQueueFull(RuntimeError):
+    """Raised when too many callers are already waiting on one API key."""
+
+
+class TokenBucketRateLimiter(BaseRateLimiter):
+    """
+    Token bucket shared by every LLM client using the same API key.
+
+    Callers that find the bucket empty queue (up to `max_queue`) and wait
+    for a refill; `penalize()` drains the bucket when the provider answers
+    429, so all bots on that key back off together.
+    """
+
+    def __init__(
+            self,
+            name: str,
+            requests_per_second: float = 5.0,
+            burst: int = 10,
+            max_queue: int = 100,
+            max_wait: float = 30.0):
+        self.name = name
+        self.rate = requests_per_second
+        self.burst = burst
+        self.max_queue = max_queue
+        self.max_wait = max_wait
+
+        self._tokens = float(burst)
+        self._last = time.monotonic()
+        self._waiting = 0
+        self._cond = threading.Condition()
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.burst, self._tokens + (now - self._last) * self.rate)
+        self._last = now
+
+    def _try_take(self) -> bool:
+        self._refill()
+        if self._tokens >= 1:
+            self._tokens -= 1
+            return True
+        return False
+
+    def _set_queue_gauge(self):
+        metrics.set_gauge("llm_ratelimit_queue_depth", self._waiting, key=self.name)
+
+    def acquire(self, *, blocking: bool = True) -> bool:
+        start = time.monotonic()
+        with self._cond:
+            if self._waiting == 0 and self._try_take():
+                metrics.observe("llm_ratelimit_wait_seconds", 0.0, key=self.name)
+                return True
+            if not blocking:
+                return False
+            if self._waiting >= self.max_queue:
+                metrics.inc("llm_ratelimit_rejected_total", key=self.name)
+                raise RateLimitQueueFull(f"Too many queued LLM calls for key {self.name}.")
+
+            self._waiting += 1
+            self._set_queue_gauge()
+            try:
+                while not self._try_take():
+                    waited = time.monotonic() - start
+                    if waited >= self.max_wait:
+                        metrics.inc("llm_ratelimit_rejected_total", key=self.name)
+                        raise RateLimitQueueFull(f"Timed out waiting for an LLM slot on key {self.name}.")
+                    self._cond.wait(timeout=min((1 - self._tokens) / self.rate, self.max_wait - waited))
+            finally:
+                self._waiting -= 1
+                self._set_queue_gauge()
+                self._cond.notify_all()
+
+        metrics.observe("llm_ratelimit_wait_seconds", time.monotonic() - start, key=self.name)
+        return True
+
+    async def aacquire(self, *, blocking: bool = True) -> bool:
+        if self.acquire(blocking=False):
+            return True
+        if not blocking:
+            return False
+        return await asyncio.get_running_loop().run_in_executor(None, self.acquire)
+
+    def penalize(self, retry_after: float = 1.0):
+        """
+        Drain the bucket so the next `retry_after` seconds yield no tokens.
+        """
+        with self._cond:
+            self._refill()
+            self._tokens = min(self._tokens, -retry_after * self.rate)
+        metrics.inc("llm_http_429_total", key=self.name)
+        logger.warning("Provider rate limit hit for key %s, backing off %.1fs", self.name, retry_after)
+
+
+class InflightTransport(httpx.BaseTransport):
+    """
+    Counts requests in `llm_http_inflight` until the response headers arrive
+    or the request fails (connect errors and timeouts never reach a response hook).
+    """
+
+    def __init__(self, transport: httpx.BaseTransport):
+        self._transport = transport
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        metrics.add_gauge("llm_http_inflight", 1)
+        try:
+            return self._transport.handle_request(request)
+        finally:
+            metrics.add_gauge("llm_http_inflight", -1)
+
+    def close(self):
+        self._transport.close()
+
+
+class AsyncInflightTransport(httpx.AsyncBaseTransport):
+    def __init__(self, transport: httpx.AsyncBaseTransport):
+        self._transport = transport
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        metrics.add_gauge("llm_http_inflight", 1)
+        try:
+            return await self._transport.handle_async_request(request)
+        finally:
+            metrics.add_gauge("llm_http_inflight", -1)
+
+    async def aclose(self):
+        await self._transport.aclose()
+
+
+class LLMClientPool:
+    """
+    Shared `ChatOpenAI` clients keyed by (API key, model).
+
+    All clients reuse one keep-alive HTTP connection pool, and every client
+    for the same API key shares one `TokenBucketRateLimiter`. Transient
+    errors and 429s are retried with exponential backoff by the OpenAI SDK
+    (`max_retries`).
+    """
+
+    def __init__(
+            self,
+            max_connections: int = None,
+            max_keepalive_connections: int = None,
+            requests_per_second: float = None,
+            burst: int = None,
+            max_retries: int = None):
+        self.max_connections = max_connections or int(os.getenv("LLM_MAX_CONNECTIONS", "50"))
+        self.max_keepalive_connections = max_keepalive_connections or int(os.getenv("LLM_MAX_KEEPALIVE", "20"))
+        self.requests_per_second = requests_per_second or float(os.getenv("OPENAI_RPS", "5"))
+        self.burst = burst or int(os.getenv("OPENAI_BURST", "10"))
+        self.max_retries = max_retries if max_retries is not None else int(os.getenv("OPENAI_MAX_RETRIES", "3"))
+
+        self._lock = threading.Lock()
+        self._clients: Dict[Tuple, ChatOpenAI] = {}
+        self._limiters: Dict[str, TokenBucketRateLimiter] = {}
+        self._http_client = None
+        self._http_async_client = None
+
+        metrics.set_gauge("llm_http_max_connections", self.max_connections)
+
+    # ---------- shared HTTP transport ----------
+    def _limits(self) -> httpx.Limits:
+        return httpx.Limits(
+            max_connections=self.max_connections,
+            max_keepalive_connections=self.max_keepalive_connections,
+        )
+
+    def _key_from_request(self, request: httpx.Request) -> str:
+        auth = request.headers.get("authorization", "")
+        return key_id(auth[len("Bearer "):] if auth.startswith("Bearer ") else None)
+
+    def _on_response(self, response: httpx.Response):
+        if response.status_code == 429:
+            limiter = self._limiters.get(self._key_from_request(response.request))
+            if limiter is not None:
+                try:
+                    retry_after = float(response.headers.get("retry-after", "1"))
+                except ValueError:
+                    retry_after = 1.0
+                limiter.penalize(retry_after)
+
+    async def _on_response_async(self, response: httpx.Response):
+        self._on_response(response)
+
+    @property
+    def http_client(self) -> httpx.Client:
+        if self._http_client is None:
+            self._http_client = httpx.Client(
+                transport=InflightTransport(httpx.HTTPTransport(limits=self._limits())),
+                timeout=httpx.Timeout(60.0, connect=10.0),
+                event_hooks={"response": [self._on_response]},
+            )
+        return self._http_client
+
+    @property
+    def http_async_client(self) -> httpx.AsyncClient:
+        if self._http_async_client is None:
+            self._http_async_client = httpx.AsyncClient(
+                transport=AsyncInflightTransport(httpx.AsyncHTTPTransport(limits=self._limits())),
+                timeout=httpx.Timeout(60.0, connect=10.0),
+                event_hooks={"response": [self._on_response_async]},
+            )
+        return self._http_async_client
+
+    # ---------- clients ----------
+    def limiter_for(self, api_key: Optional[str]) -> TokenBucketRateLimiter:
+        name = key_id(api_key)
+        limiter = self._limiters.get(name)
+        if limiter is None:
+            limiter = self._limiters[name] = TokenBucketRateLimiter(
+                name,
+                requests_per_second=self.requests_per_second,
+                burst=self.burst,
+            )
+        return limiter
+
+    def get(self, api_key: Optional[str], model: str = "gpt-4", temperature: float = 0, **kwargs) -> ChatOpenAI:
+        """
+        Return the shared client for (api_key, model, temperature, kwargs),
+        creating it on first use.
+        """
+        api_key = api_key or os.getenv("OPENAI_API_KEY")
+        cache_key = (api_key, model, temperature, tuple(sorted(kwargs.items())))
+
+        with self._lock:
+            client = self._clients.get(cache_key)
+            if client is not None:
+                metrics.inc("llm_pool_requests_total", result="hit")
+                return client
+
+            client = ChatOpenAI(
+                model=model,
+                temperature=temperature,
+                api_key=api_key,
+                http_client=self.http_client,
+                http_async_client=self.http_async_client,
+                rate_limiter=self.limiter_for(api_key),
+                max_retries=self.max_retries,
+                **kwargs,
+            )
+            self._clients[cache_key] = client
+            metrics.inc("llm_pool_requests_total", result="miss")
+            metrics.set_gauge("llm_pool_clients", len(self._clients))
+            return client
+
+    def close(self):
+        """
+        Close the sync connection pool. The async pool needs `aclose()`.
+        """
+        if self._http_client is not None:
+            self._http_client.close()
+            self._http_client = None
+        self._clients.clear()
+
+    async def aclose(self):
+        self.close()
+        if self._http_async_client is not None:
+            await self._http_async_client.aclose()
+            self._http_async_client = None
+
+
+if __name__ == '__main__':
+    print('done')
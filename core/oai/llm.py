@@ -1,77 +1,305 @@
 from core.oai.tools import *  # Make sure `tools` uses the correct folder context
+from core.oai.callbacks import TracingCallbackHandler, TurnCancelled
+from core.oai.client_pool import LLMClientPool
+from core.oai.router import ModelRouter, bot_model_settings, ESCALATION_ERRORS, FAST, STRONG
+from core.oai.prompt import PromptAssembler, bot_prompt_settings, TOOLSETS, BASE_SYSTEM_PROMPT, PROMPT_CACHE_MIN_TOKENS
+from core.utils.vectordb import bot_retrieval_settings
+from core.utils.holds import slot_holds
+from core.utils.handle_data import HandleData
+from core.utils.metrics import metrics
+from core.utils.logger import get_bot_logger, bot_log_settings
 from langchain_openai import ChatOpenAI
 from langchain.memory import ConversationBufferMemory
 from langchain.prompts import MessagesPlaceholder
 from langchain.schema import SystemMessage
 from langchain.agents import initialize_agent, AgentType
 import os
+import time
+import uuid
+import logging
+import threading
+from collections import OrderedDict
+
+# Conversations idle this long are dropped with their agents, memory and
+# slot holds; at most MAX_CONVERSATIONS are kept (least recently used go first).
+CONVERSATION_TTL = float(os.getenv("CONVERSATION_TTL", "1800"))
+MAX_CONVERSATIONS = int(os.getenv("MAX_CONVERSATIONS", "10000"))
+
+
+def session_key(bot_name: str, session_id: str = None) -> str:
+    """
+    Key for a conversation's memory. Without a session id every user of a
+    bot shares one conversation, as before sessions existed.
+    """
+    return f"{bot_name}:{session_id}" if session_id else bot_name
 
 
 class ProcessInputText:
-    def __init__(self):
+    def __init__(self, client_pool: LLMClientPool = None, handle_data: HandleData = None, conversation_ttl: float = None, max_conversations: int = None):
         self.agents = {}  
         self.memories = {} 
+        self.client_pool = client_pool or LLMClientPool()
+        self.handle_data = handle_data or HandleData()
+        self.router = ModelRouter()
+        self.prompts = PromptAssembler(self.handle_data)
+        self.preamble_tokens = {}
+        self.toolsets = {}  # conversation -> tool set of its previous turn
+
+        self.conversation_ttl = conversation_ttl if conversation_ttl is not None else CONVERSATION_TTL
+        self.max_conversations = max_conversations or MAX_CONVERSATIONS
+        self._conversations = OrderedDict()  # conversation -> (bot_name, last used), oldest first
+        self._agent_keys = {}  # conversation -> keys of its agents in self.agents
+        self._conversations_lock = threading.Lock()
+
+    def touch(self, bot_name: str, conversation: str):
+        """
+        Mark a conversation as used now and evict idle or least recently used ones.
+        """
+        now = time.monotonic()
+        with self._conversations_lock:
+            self._conversations[conversation] = (bot_name, now)
+            self._conversations.move_to_end(conversation)
+
+            evicted = []
+            while self._conversations:
+                oldest, (oldest_bot, last_used) = next(iter(self._conversations.items()))
+                if oldest == conversation:
+                    break
+                if now - last_used < self.conversation_ttl and len(self._conversations) <= self.max_conversations:
+                    break
+                del self._conversations[oldest]
+                evicted.append((oldest_bot, oldest))
+
+            for evicted_bot, evicted_conversation in evicted:
+                self._drop(evicted_bot, evicted_conversation)
+            metrics.set_gauge("conversations_active", len(self._conversations))
+        if evicted:
+            metrics.inc("conversations_evicted_total", len(evicted))
 
-    def get_or_create_agent(self, bot_name: str , system_prompt: str , api_key:str):
+    def _drop(self, bot_name: str, conversation: str):
+        for key in self._agent_keys.pop(conversation, ()):
+            self.agents.pop(key, None)
+        self.memories.pop(conversation, None)
+        self.toolsets.pop(conversation, None)
+        slot_holds.release_holder(bot_name, conversation)
+
+    def clear_conversations(self):
+        with self._conversations_lock:
+            for conversation, (bot_name, _) in list(self._conversations.items()):
+                self._drop(bot_name, conversation)
+            self._conversations.clear()
+            self.agents.clear()
+            self.memories.clear()
+
+    def get_or_create_agent(self, bot_name: str , system_prompt: str , api_key:str , config: dict = None , tier: str = STRONG , toolset: str = "all" , session_id: str = None , streaming: bool = False):
         """
         Get or initialize the agent and memory for a given bot_name (folder).
+        `config` is the bot's meta.json; its `logging` block controls agent verbosity,
+        its `models` block picks the model for each `tier` and its `prompt` block
+        the prompt wording. One agent exists per (session, tier, toolset,
+        streaming); all agents of a session share one memory.
         """
-        if bot_name in self.agents:
-            return self.agents[bot_name]
+        conversation = session_key(bot_name, session_id)
+        self.touch(bot_name, conversation)
+        key = (conversation, tier, toolset, streaming)
+        agent = self.agents.get(key)
+        if agent is not None:
+            return agent
+
+        memory = self.memories.get(conversation)
+        if memory is None:
+            memory = ConversationBufferMemory(
+                memory_key="chat_history",
+                return_messages=True ,
+                output_key="output" , k = 10)
 
-        memory = ConversationBufferMemory(
-            memory_key="chat_history",
-            return_messages=True ,
-            output_key="output" , k = 10)
+        # Shared per (api_key, model): one connection pool and rate limiter for all bots
+        model = bot_model_settings(config)[tier]
+        if streaming:
+            # Token-by-token output; stream_usage keeps token counts in the traces
+            llm = self.client_pool.get(api_key, model=model, temperature=0, streaming=True, stream_usage=True)
+        else:
+            llm = self.client_pool.get(api_key, model=model, temperature=0)
 
-        llm = ChatOpenAI(
-            temperature=0,
-            model="gpt-4",
-            api_key=api_key
+        # Static system message first, fixed tool order, history last: the
+        # preamble is identical across turns that use the same tool set.
+        compact = bot_prompt_settings(config)["compact"]
+        system_content = self.prompts.system_prompt(system_prompt, config) + f"\n\n[please use this as BotName: {bot_name}]"
+        agent_tools = tools(
+            bot_name, compact=compact, names=TOOLSETS[toolset], session_id=conversation,
+            retrieval=bot_retrieval_settings(config), handle_data=self.handle_data,
+        )
+        self.preamble_tokens[(bot_name, toolset)] = (
+            self.prompts.preamble_tokens(
+                ("baseline", bot_name),
+                (system_prompt or BASE_SYSTEM_PROMPT) + f"\n\n[please use this as BotName: {bot_name}]",
+                lambda: tools(bot_name, handle_data=self.handle_data),
+            ),
+            self.prompts.preamble_tokens((bot_name, toolset, compact), system_content, agent_tools),
         )
-       
 
         agent = initialize_agent(
-            tools=tools(bot_name), 
+            tools=agent_tools, 
             llm=llm,
             agent=AgentType.OPENAI_FUNCTIONS,
-            verbose=True,
+            verbose=bot_log_settings(config)["verbose_agent"],
             memory=memory,
             agent_kwargs={
-                "system_message": SystemMessage(
-                    content=(
-                        system_prompt + f"\n\n[please use this as BotName: {bot_name}]"
-                    )
-                ),
+                "system_message": SystemMessage(content=system_content),
                 "extra_prompt_messages": [MessagesPlaceholder(variable_name="chat_history")],
             },
         )
 
-        self.agents[bot_name] = agent
-        self.memories[bot_name] = memory
+        with self._conversations_lock:
+            self.agents[key] = agent
+            self.memories[conversation] = memory
+            self._agent_keys.setdefault(conversation, set()).add(key)
         return agent
 
-    def process(self, bot_name: str, user_input: str  , system_prompt : str , api_key : str) -> str:
+    def route(self, bot_name: str, user_input: str, config: dict = None, session_id: str = None):
+        """
+        Pick the model tier for this turn. Returns (tier, model, reason).
+        """
+        settings = bot_model_settings(config)
+        memory = self.memories.get(session_key(bot_name, session_id))
+        history = memory.chat_memory.messages if memory else []
+        tier, reason = self.router.choose(user_input, history, settings["routing"])
+        return tier, settings[tier], reason
+
+    def select_tools(self, bot_name: str, user_input: str, config: dict = None, session_id: str = None) -> str:
+        """
+        Pick the tool set sent with this turn (see `TOOLSETS`).
+        """
+        memory = self.memories.get(session_key(bot_name, session_id))
+        history = memory.chat_memory.messages if memory else []
+        return self.prompts.select_toolset(bot_name, user_input, history, config)
+
+    def record_prompt_savings(self, bot_name: str, toolset: str, config: dict, handler: TracingCallbackHandler, session_id: str = None):
+        """
+        Report the preamble tokens saved this turn versus the full prompt and
+        tool set, next to the prompt tokens the provider served from cache.
+        """
+        conversation = session_key(bot_name, session_id)
+        previous = self.toolsets.get(conversation)
+        self.toolsets[conversation] = toolset
+
+        llm_calls = handler.llm_calls
+        baseline, assembled = self.preamble_tokens.get((bot_name, toolset), (0, 0))
+        saved = self.prompts.record(
+            bot_name, toolset, bot_prompt_settings(config)["compact"],
+            baseline * llm_calls, assembled * llm_calls,
+            cached=handler.cached_tokens, switched=previous is not None and previous != toolset,
+        )
+        get_bot_logger(bot_name, config).debug(
+            "prompt preamble: %d tokens x %d calls (toolset=%s, previous=%s), saved %d, cached %d%s",
+            assembled, llm_calls, toolset, previous, saved, handler.cached_tokens,
+            "" if assembled >= PROMPT_CACHE_MIN_TOKENS else " (below cacheable size)",
+        )
+
+    def log_transcript(self, bot_name: str, config: dict = None, session_id: str = None):
+        """
+        Dump the conversation memory at DEBUG level. Transcripts contain
+        patient names, so this only runs when `log_transcripts` is enabled.
+        """
+        if not bot_log_settings(config)["log_transcripts"]:
+            return
+        logger = get_bot_logger(bot_name, config)
+        conversation = session_key(bot_name, session_id)
+        if logger.isEnabledFor(logging.DEBUG) and conversation in self.memories:
+            logger.debug("transcript %s: %s", conversation, self.memories[conversation].chat_memory.messages)
+
+    def process(self, bot_name: str, user_input: str  , system_prompt : str , api_key : str , config: dict = None , session_id: str = None , callbacks: list = None , streaming: bool = False) -> str:
         """
         Process user input using the agent specific to the given bot_name.
+        Extra `callbacks` receive the run's events; with `streaming` the LLM
+        emits tokens to them as they arrive.
         """
-        print('*'*10)
-        print(self.memories[bot_name])
-        print('*'*10)
-        agent = self.get_or_create_agent(bot_name , system_prompt , api_key )
-        return agent.invoke({"input": user_input})["output"]
+        tier, model, reason = self.route(bot_name, user_input, config, session_id)
+        toolset = self.select_tools(bot_name, user_input, config, session_id)
+        self.log_transcript(bot_name, config, session_id)
+
+        while True:
+            agent = self.get_or_create_agent(bot_name , system_prompt , api_key , config , tier , toolset , session_id , streaming)
+            handler = TracingCallbackHandler(bot_name)
+            start = time.perf_counter()
+            try:
+                with metrics.span("agent", bot=bot_name, tier=tier, model=model, toolset=toolset):
+                    result = agent.invoke(
+                        {"input": user_input},
+                        config={"callbacks": [handler] + list(callbacks or [])},
+                    )
+            except TurnCancelled:
+                metrics.inc("agent_turns_cancelled_total")
+                raise
+            except ESCALATION_ERRORS as e:
+                # A failed tool call (bad arguments, unparseable date/time) on the
+                # fast tier is retried once on the strong tier. Memory is only
+                # written on success, but tool effects are not undone, so a turn
+                # that already booked a slot is not retried.
+                if not self.router.should_escalate(tier, e, handler.tools_run):
+                    raise
+                self.router.record_escalation(model, e)
+                get_bot_logger(bot_name, config).info("escalating turn from %s: %s", model, e)
+                strong = bot_model_settings(config)[STRONG]
+                # The strong tier replays the turn, so events the callbacks already
+                # received (tokens, tool calls) are void; tell them.
+                for callback in callbacks or []:
+                    callback.on_custom_event("escalated", {"from": model, "to": strong, "error": str(e)}, run_id=uuid.uuid4())
+                tier, model, reason = STRONG, strong, "escalated"
+                toolset = "all"
+                continue
+
+            self.router.record(tier, model, time.perf_counter() - start, reason)
+            self.record_prompt_savings(bot_name, toolset, config, handler, session_id)
+            return result["output"]
     
-    def process_stream(self, bot_name: str, user_input: str, system_prompt: str, api_key: str):
+    def process_stream(self, bot_name: str, user_input: str, system_prompt: str, api_key: str, config: dict = None, session_id: str = None):
         """
         Stream the agent's reasoning steps and final output for the given bot_name.
         Yields chunks suitable for SSE/WebSocket or console output.
         """
-        agent = self.get_or_create_agent(bot_name, system_prompt, api_key)
-        
-        for step in agent.stream({"input": user_input}):
-            # `step` is a dict that can include "thought", "tool", "tool_input", etc.
-            # Yield each step as a JSON-serializable dict or formatted text
-            yield step
+        tier, model, reason = self.route(bot_name, user_input, config, session_id)
+        toolset = self.select_tools(bot_name, user_input, config, session_id)
+        self.log_transcript(bot_name, config, session_id)
+
+        while True:
+            agent = self.get_or_create_agent(bot_name, system_prompt, api_key, config, tier, toolset, session_id)
+            handler = TracingCallbackHandler(bot_name)
+            start = time.perf_counter()
+
+            # Generators may resume in a different context, so the span is ended
+            # explicitly instead of going through the `metrics.span` context manager.
+            span = metrics.start_span("agent", bot=bot_name, streaming=True, tier=tier, model=model, toolset=toolset)
+            try:
+                for step in agent.stream(
+                    {"input": user_input},
+                    config={"callbacks": [handler]},
+                ):
+                    # `step` is a dict that can include "thought", "tool", "tool_input", etc.
+                    # Yield each step as a JSON-serializable dict or formatted text
+                    yield step
+            except ESCALATION_ERRORS as e:
+                span.end(error=e)
+                if not self.router.should_escalate(tier, e, handler.tools_run):
+                    raise
+                # Same escalation as `process`. The strong tier replays the turn,
+                # so the steps already yielded are void.
+                self.router.record_escalation(model, e)
+                get_bot_logger(bot_name, config).info("escalating turn from %s: %s", model, e)
+                strong = bot_model_settings(config)[STRONG]
+                yield {"escalated": {"from": model, "to": strong, "error": str(e)}}
+                tier, model, reason = STRONG, strong, "escalated"
+                toolset = "all"
+                continue
+            except Exception as e:
+                span.end(error=e)
+                raise
+            finally:
+                span.end()
+
+            self.router.record(tier, model, time.perf_counter() - start, reason)
+            self.record_prompt_savings(bot_name, toolset, config, handler, session_id)
+            return
 
 
 if __name__ == '__main__':
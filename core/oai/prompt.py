@@ -0,0 +1,245 @@
+import os
+import re
+import json
+from typing import Dict, List, Optional, Tuple
+
+from langchain.schema import HumanMessage
+from langchain_core.utils.function_calling import convert_to_openai_function
+
+from core.utils.metrics import metrics
+from core.utils.handle_data import HandleData
+
+
+BASE_SYSTEM_PROMPT = """
+You are an appointment scheduling assistant. Your job is to help users book, check, or view appointment slots using tools. Never make assumptions. Always collect required inputs and call tools with the correct parameters.
+
+---
+
+TOOL USAGE RULES:
+
+- Use `get_datetime_tool` to convert vague phrases (e.g. "tomorrow at 9") into exact datetime.
+- Use `check_availability_tool` only if both `date` and `time` are known.
+- Use `book_appointment_tool` only if `date`, `time`, and `patient_name` are confirmed.
+- Use `list_free_slots_tool` if the user wants to view open slots for a specific date.
+- Use `context_tool` to answer questions like doctor name, clinic location, hours, etc.
+- Use `reschedule_appointment_tool` for any rescheduling or cancellation request (not supported).
+- Use `escalate_to_human_tool` if:
+  - The request is vague or unsupported
+  - Tools fail multiple times
+  - The user asks for human help
+
+Do not answer these requests directly — always use the corresponding tool to fetch and return results.
+
+---
+
+FEW-SHOT EXAMPLES:
+
+User: Can you book 9 AM?  
+Assistant: I’ll need the date and your name to proceed.
+
+User: Book tomorrow at 9 for Rahul.  
+Assistant: Converting "tomorrow at 9" using `get_datetime_tool`...  
+→ Then call `book_appointment_tool`.
+
+User: I need to cancel.  
+Assistant: Cancellation isn’t supported.  
+→ Call `reschedule_appointment_tool`.
+
+User: Who is the doctor?  
+→ Call `context_tool`.
+
+User: I’m confused. Book any time next week.  
+→ Call `escalate_to_human_tool` with reason: unclear scheduling request.
+
+---
+
+BEHAVIORAL RULES:
+
+- Never guess missing inputs — ask clearly.
+- Use step-by-step logic: collect → convert → check → book.
+- Always rely on tools — do not answer with memory alone.
+- Do not repeat tool results — just return them clearly.
+
+Use tools to act, ask questions to clarify, and escalate only when necessary.
+"""
+
+
+# Same rules as BASE_SYSTEM_PROMPT, without the few-shot block. Tool-specific
+# guidance lives in the (compact) tool descriptions instead.
+COMPACT_SYSTEM_PROMPT = """
+You are an appointment scheduling assistant. Act only through the provided tools.
+Rules:
+- Never guess missing inputs; ask for them.
+- Flow: collect → convert (get_datetime_tool) → check → book.
+- Booking needs date, time (with AM/PM) and patient_name.
+- Rescheduling/cancellation is unsupported: use reschedule_appointment_tool.
+- Escalate vague/unsupported requests, repeated tool failures or requests for a human.
+- Return tool results clearly without repeating them.
+"""
+
+
+COMPACT_TOOL_DESCRIPTIONS = {
+    "check_availability_tool": "Check if a date and time (with AM/PM) slot is free; a free slot is held briefly.",
+    "book_appointment_tool": "Book a free slot. Needs confirmed date, time (AM/PM) and patient_name.",
+    "list_free_slots_tool": "List free times for a date.",
+    "get_datetime_tool": "Convert natural language (e.g. 'tomorrow at 9 am') to 'YYYY-MM-DD [HH:MM AM/PM]'.",
+    "reschedule_appointment_tool": "Handle reschedule/cancel requests (not supported).",
+    "context_tool": "Answer clinic questions (doctor, location, hours, fees) from the bot's documents.",
+    "escalate_to_human_tool": "Hand the user a human support form.",
+}
+
+
+# Tool subsets sent to the model. The order inside each set is fixed so the
+# serialized functions of one set are byte-identical across turns. The cached
+# prefix includes the functions, so switching sets between turns of a
+# conversation restarts prefix caching for it.
+TOOLSETS = {
+    "scheduling": [
+        "check_availability_tool",
+        "book_appointment_tool",
+        "list_free_slots_tool",
+        "get_datetime_tool",
+        "escalate_to_human_tool",
+    ],
+    "knowledge": [
+        "context_tool",
+        "escalate_to_human_tool",
+    ],
+    "all": [
+        "check_availability_tool",
+        "book_appointment_tool",
+        "list_free_slots_tool",
+        "get_datetime_tool",
+        "reschedule_appointment_tool",
+        "context_tool",
+        "escalate_to_human_tool",
+    ],
+}
+
+
+# Providers only cache prompt prefixes of at least this many tokens (OpenAI: 1024).
+PROMPT_CACHE_MIN_TOKENS = int(os.getenv("PROMPT_CACHE_MIN_TOKENS", "1024"))
+
+
+def bot_prompt_settings(config: Optional[dict]) -> dict:
+    """
+    Resolve prompt assembly settings from the `prompt` block of a bot's meta.json:
+
+        "prompt": {"compact": true, "tool_selection": true}
+
+    Bots without the block keep the full prompt and all tools.
+    """
+    settings = dict((config or {}).get("prompt") or {})
+    return {
+        "compact": bool(settings.get("compact", os.getenv("PROMPT_COMPACT", "0") == "1")),
+        "tool_selection": bool(settings.get("tool_selection", os.getenv("PROMPT_TOOL_SELECTION", "0") == "1")),
+    }
+
+
+def _encoder():
+    try:
+        import tiktoken
+        return tiktoken.get_encoding("cl100k_base")
+    except Exception:
+        return None
+
+
+class PromptAssembler:
+    """
+    Builds the fixed part of each LLM call (system prompt + tool schemas):
+    compact wording when enabled, only the tools relevant to the current
+    turn, and a fixed layout within each tool set.
+
+    Trimming and prefix caching pull against each other: a tool set switch
+    between turns changes the cached prefix, and a compact preamble is
+    usually shorter than `PROMPT_CACHE_MIN_TOKENS` and never cached anyway.
+    `record` reports both sides so they can be compared per bot.
+    """
+
+    SCHEDULING = re.compile(
+        r"(book|appointment|slot|avail|free|schedule|today|tomorrow|\bday after\b|\d{1,2}(:\d{2})?\s*(am|pm)|"
+        r"\b(mon|tue|wed|thu|fri|sat|sun)[a-z]*\b|\b\d{4}-\d{2}-\d{2}\b|my name|\bi am\b|\bi'm\b|^(yes|no|ok|okay|sure)\b)",
+        re.IGNORECASE,
+    )
+    KNOWLEDGE = re.compile(
+        r"(doctor|clinic|where|address|location|hours|timing|open|close|fee|cost|price|insurance|"
+        r"service|treat|parking|contact|phone|who)",
+        re.IGNORECASE,
+    )
+    UNSUPPORTED = re.compile(r"(cancel|reschedul|human|agent|complain|refund)", re.IGNORECASE)
+
+    def __init__(self, handle_data: HandleData = None):
+        self.handle_data = handle_data or HandleData()
+        self._encoding = _encoder()
+        self._token_cache: Dict[Tuple, int] = {}
+
+    def system_prompt(self, system_prompt: Optional[str], config: Optional[dict]) -> str:
+        """
+        Swap the stock prompt for its compact form. Custom prompts are kept as-is.
+        """
+        system_prompt = system_prompt or BASE_SYSTEM_PROMPT
+        if bot_prompt_settings(config)["compact"] and system_prompt.strip() == BASE_SYSTEM_PROMPT.strip():
+            return COMPACT_SYSTEM_PROMPT.strip()
+        return system_prompt
+
+    def has_knowledge_base(self, bot_name: str) -> bool:
+        return os.path.exists(os.path.join(self.handle_data.get_index_dir(bot_name), "faiss"))
+
+    def select_toolset(self, bot_name: str, user_input: str, history: List, config: Optional[dict]) -> str:
+        """
+        Pick the smallest tool set that covers the turn. Anything ambiguous,
+        unsupported requests and the first turn get every tool.
+        """
+        if not bot_prompt_settings(config)["tool_selection"]:
+            return "all"
+        if not any(isinstance(m, HumanMessage) for m in history):
+            return "all"
+        if self.UNSUPPORTED.search(user_input):
+            return "all"
+
+        scheduling = bool(self.SCHEDULING.search(user_input))
+        knowledge = bool(self.KNOWLEDGE.search(user_input)) and self.has_knowledge_base(bot_name)
+        if scheduling and not knowledge:
+            return "scheduling"
+        if knowledge and not scheduling:
+            return "knowledge"
+        return "all"
+
+    def count_tokens(self, text: str) -> int:
+        if self._encoding is None:
+            return max(1, len(text) // 4)
+        return len(self._encoding.encode(text))
+
+    def preamble_tokens(self, cache_key: Tuple, system_prompt: str, tool_list) -> int:
+        """
+        Approximate prompt tokens of the system message plus function schemas.
+        `tool_list` may be a callable, so the tools are only built on a cache miss.
+        """
+        if cache_key not in self._token_cache:
+            if callable(tool_list):
+                tool_list = tool_list()
+            functions = [convert_to_openai_function(t) for t in tool_list]
+            self._token_cache[cache_key] = self.count_tokens(system_prompt) + self.count_tokens(
+                json.dumps(functions, separators=(",", ":"))
+            )
+        return self._token_cache[cache_key]
+
+    def record(
+            self, bot_name: str, toolset: str, compact: bool, baseline: int, assembled: int,
+            cached: int = 0, switched: bool = False) -> int:
+        """
+        `cached` is the prompt tokens the provider served from its prefix
+        cache this turn; `switched` means the tool set differs from the
+        conversation's previous turn, so the cached prefix could not be reused.
+        """
+        saved = max(0, baseline - assembled)
+        metrics.inc("prompt_preamble_tokens_total", assembled, toolset=toolset, compact=compact)
+        metrics.inc("prompt_tokens_saved_total", saved, toolset=toolset, compact=compact)
+        metrics.inc("prompt_cached_tokens_total", cached, toolset=toolset, compact=compact)
+        if switched:
+            metrics.inc("prompt_toolset_switches_total", toolset=toolset)
+        return saved
+
+
+if __name__ == '__main__':
+    print('done')
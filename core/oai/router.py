@@ -0,0 +1,116 @@
+import os
+import re
+from typing import List, Optional, Tuple
+
+from langchain.schema import AIMessage, HumanMessage
+from langchain_core.exceptions import OutputParserException
+from langchain_core.tools import ToolException
+from pydantic import ValidationError
+
+from core.utils.metrics import metrics
+
+
+FAST = "fast"
+STRONG = "strong"
+
+DEFAULT_MODELS = {
+    FAST: os.getenv("FAST_MODEL", "gpt-4o-mini"),
+    STRONG: os.getenv("STRONG_MODEL", "gpt-4"),
+}
+
+# Bots without a `models` block keep the original single-model behaviour.
+DEFAULT_ROUTING = os.getenv("MODEL_ROUTING", STRONG)
+
+# Fast-tier failures worth a strong-tier retry: bad tool arguments, an
+# unparseable function call, or a date/time `normalize_*` rejected.
+# Provider, network and rate-limit errors are not retried on another model.
+ESCALATION_ERRORS = (ValidationError, OutputParserException, ToolException, ValueError)
+
+# Tools whose effect a retry would repeat; once one has run, a turn is not escalated.
+SIDE_EFFECT_TOOLS = {"book_appointment_tool"}
+
+
+def bot_model_settings(config: Optional[dict]) -> dict:
+    """
+    Resolve the model tiers for a bot from the `models` block of its meta.json:
+
+        "models": {"fast": "gpt-4o-mini", "strong": "gpt-4", "routing": "auto"}
+
+    `routing` is "auto" (let the router decide), "fast" or "strong" (pin one tier).
+    """
+    settings = dict((config or {}).get("models") or {})
+    return {
+        FAST: settings.get(FAST) or DEFAULT_MODELS[FAST],
+        STRONG: settings.get(STRONG) or DEFAULT_MODELS[STRONG],
+        "routing": settings.get("routing") or DEFAULT_ROUTING,
+    }
+
+
+class ModelRouter:
+    """
+    Picks the model tier for a turn from the message and conversation state.
+
+    Slot-filling turns ("yes", "my name is Rahul", "tomorrow 9 AM") that
+    answer a question the assistant just asked go to the fast tier; first
+    turns, questions, cancellations and anything long go to the strong tier.
+    """
+
+    CONFIRMATIONS = re.compile(
+        r"^(yes|yeah|yep|yup|ok|okay|sure|no|nope|correct|confirm(ed)?|go ahead|please do|that works)\b",
+        re.IGNORECASE,
+    )
+    SLOT_VALUES = re.compile(
+        r"(my name is|i am|i'm|this is|name:|\b\d{1,2}(:\d{2})?\s*(am|pm)\b|\btoday\b|\btomorrow\b|"
+        r"\bday after\b|\b(mon|tue|wed|thu|fri|sat|sun)[a-z]*\b|\b\d{4}-\d{2}-\d{2}\b)",
+        re.IGNORECASE,
+    )
+    COMPLEX = re.compile(
+        r"(\b(who|where|what|why|how|which|when)\b|cancel|reschedul|human|help|complain|refund|"
+        r"doctor|clinic|address|\bfee)",
+        re.IGNORECASE,
+    )
+
+    def __init__(self, max_fast_words: int = 8):
+        self.max_fast_words = max_fast_words
+
+    def choose(self, user_input: str, history: List, routing: str = "auto") -> Tuple[str, str]:
+        """
+        Returns (tier, reason).
+        """
+        if routing in (FAST, STRONG):
+            return routing, "pinned"
+
+        text = user_input.strip()
+        if not any(isinstance(m, HumanMessage) for m in history):
+            return STRONG, "first_turn"
+        if len(text.split()) > self.max_fast_words:
+            return STRONG, "long_message"
+        if self.COMPLEX.search(text):
+            return STRONG, "complex_intent"
+
+        last_ai = next((m for m in reversed(history) if isinstance(m, AIMessage)), None)
+        awaiting_input = last_ai is not None and "?" in (last_ai.content or "")
+        if awaiting_input and (self.CONFIRMATIONS.search(text) or self.SLOT_VALUES.search(text)):
+            return FAST, "slot_filling"
+        if self.CONFIRMATIONS.search(text):
+            return FAST, "confirmation"
+
+        return STRONG, "default"
+
+    def record(self, tier: str, model: str, seconds: float, reason: str):
+        metrics.inc("llm_tier_turns_total", tier=tier, reason=reason)
+        metrics.observe("llm_tier_turn_seconds", seconds, tier=tier, model=model)
+
+    def should_escalate(self, tier: str, error: BaseException, tools_run: list) -> bool:
+        return (
+            tier == FAST
+            and isinstance(error, ESCALATION_ERRORS)
+            and not SIDE_EFFECT_TOOLS.intersection(tools_run)
+        )
+
+    def record_escalation(self, from_model: str, error: BaseException):
+        metrics.inc("llm_tier_escalations_total", model=from_model, error=type(error).__name__)
+
+
+if __name__ == '__main__':
+    print('done')
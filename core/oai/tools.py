@@ -3,13 +3,20 @@ import pandas as pd
 import dateparser
 import os
 from dotenv import load_dotenv
-from core.utils.vectordb import *
+from core.utils.knowledge import get_knowledge_base
+from core.utils.metrics import metrics
+from core.oai.prompt import COMPACT_TOOL_DESCRIPTIONS
+from core.utils.holds import slot_holds
+from core.utils.availability import availability, file_signature
+from core.utils.handle_data import HandleData
+from collections import defaultdict
 from datetime import datetime
+import threading
 
 # we need to add human in the loop 
 
 load_dotenv()
-indexers = {}
+schedule_locks = defaultdict(threading.Lock)  # bot_name -> lock around schedule read-modify-write
 
 def normalize_date(date_str: str) -> str:
     """
@@ -22,7 +29,8 @@ def normalize_date(date_str: str) -> str:
     Returns:
         str: Formatted date in YYYY-MM-DD or None.
     """
-    dt = dateparser.parse(date_str, settings={"PREFER_DATES_FROM": "future"})
+    with metrics.span("dateparser"):
+        dt = dateparser.parse(date_str, settings={"PREFER_DATES_FROM": "future"})
     return dt.strftime("%Y-%m-%d") if dt else None
 
 
@@ -40,25 +48,43 @@ def normalize_time(time_str: str) -> str:
     if "am" not in time_str.lower() and "pm" not in time_str.lower():
         raise ValueError("⏰ Please specify AM or PM in the time you provided.")
     
-    parsed_time = dateparser.parse(time_str)
+    with metrics.span("dateparser"):
+        parsed_time = dateparser.parse(time_str)
     if not parsed_time:
         raise ValueError("⏰ Couldn't understand the time format. Please rephrase (e.g., '9:00 AM').")
     
     return parsed_time.strftime("%I:%M %p")
 
 
-def tools(bot_name: str):
+def tools(bot_name: str, compact: bool = False, names: list = None, session_id: str = None, retrieval: dict = None, handle_data: HandleData = None):
     """
     Factory function that returns a list of LangChain-compatible tools
     for appointment handling. All tools operate on a bot-specific CSV.
 
     Args:
         bot_name (str): Unique bot folder name.
+        compact (bool): Use the short tool descriptions (fewer prompt tokens).
+        names (list): Only return these tools, in this order.
+        session_id (str): Conversation that owns slot holds made by these tools.
+        retrieval (dict): The bot's retrieval settings (top_k, fusion weights).
+        handle_data (HandleData): Resolves the bot's schedule and index paths;
+            pass the caller's so every component uses the same data roots.
 
     Returns:
         List of LangChain tool functions.
     """
-    schedule_path = os.path.join("bots_data", bot_name, "schedule.csv")
+    handle_data = handle_data or HandleData()
+    schedule_path = handle_data.get_schedule_path(bot_name)
+    holder = session_id or bot_name
+
+    def read_schedule() -> pd.DataFrame:
+        with metrics.span("csv:read", bot=bot_name):
+            # An all-empty patient_name column would otherwise load as float64
+            return pd.read_csv(schedule_path, dtype={"patient_name": object})
+
+    def write_schedule(df: pd.DataFrame):
+        with metrics.span("csv:write", bot=bot_name):
+            df.to_csv(schedule_path, index=False)
 
     def check_availability(date: str, time: str) -> str:
         """
@@ -71,7 +97,7 @@ def tools(bot_name: str):
         Returns:
             str: Availability message.
         """
-        df = pd.read_csv(schedule_path)
+        df = read_schedule()
         date = normalize_date(date)
         time = normalize_time(time)
         slot = df[(df["date"] == date) & (df["time"] == time)]
@@ -80,7 +106,12 @@ def tools(bot_name: str):
             return "No such slot found."
         elif slot.iloc[0]["is_booked"]:
             return f"{time} on {date} is already booked."
-        return f"{time} on {date} is available."
+
+        # Hold the slot for this session while the agent collects the remaining details
+        if not slot_holds.hold(bot_name, date, time, holder, row=int(slot.index[0])):
+            return f"{time} on {date} is temporarily held by another patient. Please choose another slot."
+        minutes = max(1, int(slot_holds.ttl // 60))
+        return f"{time} on {date} is available and held for you for {minutes} minutes."
 
     def book_appointment(date: str, time: str, patient_name: str) -> str:
         """
@@ -94,7 +125,6 @@ def tools(bot_name: str):
         Returns:
             str: Confirmation or error message.
         """
-        df = pd.read_csv(schedule_path)
         date = normalize_date(date)
         time = normalize_time(time)
         # Just compare directly with today's date
@@ -105,16 +135,30 @@ def tools(bot_name: str):
                 "Please use get_datetime_tool to clarify or or ask user for date"
             )
 
-        idx = df[(df["date"] == date) & (df["time"] == time)].index
+        if slot_holds.is_held_by_other(bot_name, date, time, holder):
+            return "Slot is temporarily held by another patient. Please choose another slot."
+
+        with schedule_locks[bot_name]:
+            signature = file_signature(schedule_path)
+            df = read_schedule()
+
+            # A hold from check_availability remembers the row, so converting
+            # it skips the full-table scan (falls back if the schedule changed).
+            hold = slot_holds.take(bot_name, date, time, holder)
+            row = hold.row if hold is not None else None
+            if row is None or row not in df.index or df.at[row, "date"] != date or df.at[row, "time"] != time:
+                idx = df[(df["date"] == date) & (df["time"] == time)].index
+                if len(idx) == 0:
+                    return "Slot not found."
+                row = idx[0]
 
-        if len(idx) == 0:
-            return "Slot not found."
-        if df.loc[idx[0], "is_booked"]:
-            return "Slot is already booked."
+            if df.loc[row, "is_booked"]:
+                return "Slot is already booked."
 
-        df.at[idx[0], "is_booked"] = True
-        df.at[idx[0], "patient_name"] = patient_name
-        df.to_csv(schedule_path, index=False)
+            df.at[row, "is_booked"] = True
+            df.at[row, "patient_name"] = patient_name
+            write_schedule(df)
+            availability.record_booking(bot_name, date, signature, schedule_path)
 
         return f"Appointment booked for {patient_name} at {time} on {date}."
 
@@ -129,7 +173,7 @@ def tools(bot_name: str):
         Returns:
             str: List of time slots or message if none are available.
         """
-        df = pd.read_csv(schedule_path)
+        df = read_schedule()
         date = normalize_date(date)
 
         # Just compare directly with today's date
@@ -154,6 +198,11 @@ def tools(bot_name: str):
 
             filtered_df = filtered_df[filtered_df["time"].apply(is_future_time)]
 
+        # Hide slots other sessions are holding
+        held = {t for d, t in slot_holds.held_by_others(bot_name, holder) if d == date}
+        if held:
+            filtered_df = filtered_df[~filtered_df["time"].isin(held)]
+
         if filtered_df.empty:
             return "No free slots available on that date."
 
@@ -165,7 +214,8 @@ def tools(bot_name: str):
         Returns full datetime if time is mentioned,
         otherwise just the date.
         """
-        dt = dateparser.parse(text, settings={"PREFER_DATES_FROM": "future"})
+        with metrics.span("dateparser"):
+            dt = dateparser.parse(text, settings={"PREFER_DATES_FROM": "future"})
         if not dt:
             return "❌ Could not understand the datetime. Please rephrase."
 
@@ -185,6 +235,7 @@ def tools(bot_name: str):
         """
         Tool: Check availability for a specific date and time slot.
         Requires both date and time with AM/PM.
+        A free slot is held for this conversation for a few minutes.
         """
         return check_availability(date, time)
 
@@ -228,11 +279,10 @@ def tools(bot_name: str):
         for a given query (`user_text`) using the vector store specific to the bot (`bot_name`). 
         Helps the agent answer user queries based on the uploaded PDF content.
         """
-        if bot_name not in indexers:
-            indexers[bot_name] = PDFIndexer()
-
-        index_dir = os.path.join("vector_store", bot_name)
-        results = indexers[bot_name].get_top_k_results(index_dir, user_text)
+        index_dir = handle_data.get_index_dir(bot_name)
+        results = get_knowledge_base(index_dir, retrieval).search(user_text)
+        if not results:
+            return "No documents have been uploaded for this bot."
         return results[0]['text']
     
 
@@ -253,7 +303,7 @@ def tools(bot_name: str):
 
 
 
-    return [
+    all_tools = [
         check_availability_tool,
         book_appointment_tool,
         list_free_slots_tool,
@@ -263,6 +313,16 @@ def tools(bot_name: str):
         escalate_to_human_tool
     ]
 
+    if compact:
+        for t in all_tools:
+            t.description = COMPACT_TOOL_DESCRIPTIONS.get(t.name, t.description)
+
+    if names is not None:
+        by_name = {t.name: t for t in all_tools}
+        return [by_name[name] for name in names]
+
+    return all_tools
+
 
 if __name__ == '__main__':
     print('✅ Tool module is ready.')
@@ -0,0 +1,218 @@
+import os
+import math
+import time
+import asyncio
+from contextlib import asynccontextmanager
+from typing import Callable, Dict, Optional
+
+import anyio
+
+from core.utils.metrics import metrics
+
+
+class Overloaded(Exception):
+    """
+    Raised when a request is not admitted. Carries a Retry-After hint derived
+    from the queue depth and the recent service time of the pool.
+    """
+
+    def __init__(self, pool: str, reason: str, retry_after: int, queue_depth: int):
+        super().__init__(f"{pool} is overloaded ({reason}). Retry after {retry_after}s.")
+        self.pool = pool
+        self.reason = reason
+        self.retry_after = retry_after
+        self.queue_depth = queue_depth
+
+
+class WorkPool:
+    """
+    Admission control plus dedicated worker threads for one kind of work
+    (chat, streaming or ingestion).
+
+    - At most `max_concurrency` requests run at once, on the pool's own
+      threads, so one kind of work cannot starve another.
+    - At most `max_queue` requests wait; beyond that they are rejected.
+    - Each bot may run `per_bot_limit` requests and queue as many again;
+      a busy bot gets 429s instead of filling the pool for everyone.
+    """
+
+    def __init__(
+            self,
+            name: str,
+            max_concurrency: int,
+            max_queue: int,
+            per_bot_limit: int,
+            max_wait: float = 30.0,
+            controller: "AdmissionController" = None):
+        self.name = name
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.per_bot_limit = per_bot_limit
+        self.max_wait = max_wait
+        self.controller = controller
+
+        self.limiter = anyio.CapacityLimiter(max_concurrency)
+        self._sem: Optional[asyncio.Semaphore] = None  # created inside the event loop
+        self._bot_sems: Dict[str, asyncio.Semaphore] = {}
+        self._bot_pending: Dict[str, int] = {}
+        self.active = 0
+        self.waiting = 0
+        self._service_time = 1.0  # EWMA, seconds
+
+    def retry_after(self) -> int:
+        return max(1, math.ceil(self._service_time * (self.waiting + 1) / self.max_concurrency))
+
+    def _reject(self, reason: str):
+        metrics.inc("admission_rejected_total", pool=self.name, reason=reason)
+        raise Overloaded(self.name, reason, self.retry_after(), self.waiting)
+
+    def _gauges(self):
+        metrics.set_gauge("admission_active", self.active, pool=self.name)
+        metrics.set_gauge("admission_queue_depth", self.waiting, pool=self.name)
+
+    async def acquire(self, bot_name: str, reject: bool = True) -> "Ticket":
+        """
+        Take a slot in this pool for `bot_name`. With `reject=False` (batch
+        work) the caller waits instead of being turned away. The returned
+        ticket must be released exactly once; extra releases are ignored.
+        """
+        if reject:
+            if self.waiting >= self.max_queue:
+                self._reject("queue_full")
+            if self._bot_pending.get(bot_name, 0) >= 2 * self.per_bot_limit:
+                self._reject("bot_busy")
+            if self.controller is not None and self.controller.saturated():
+                self._reject("global_limit")
+
+        if self._sem is None:
+            self._sem = asyncio.Semaphore(self.max_concurrency)
+        bot_sem = self._bot_sems.get(bot_name)
+        if bot_sem is None:
+            bot_sem = self._bot_sems[bot_name] = asyncio.Semaphore(self.per_bot_limit)
+
+        self._bot_pending[bot_name] = self._bot_pending.get(bot_name, 0) + 1
+        self.waiting += 1
+        self._gauges()
+        acquired = []
+        try:
+            timeout = self.max_wait if reject else None
+            try:
+                await asyncio.wait_for(bot_sem.acquire(), timeout)
+                acquired.append(bot_sem)
+                await asyncio.wait_for(self._sem.acquire(), timeout)
+                acquired.append(self._sem)
+            except asyncio.TimeoutError:
+                self._reject("timeout")
+        except BaseException:
+            for sem in acquired:
+                sem.release()
+            self._release_bot(bot_name)
+            raise
+        finally:
+            self.waiting -= 1
+            self._gauges()
+
+        self.active += 1
+        if self.controller is not None:
+            self.controller.inflight += 1
+        self._gauges()
+        return Ticket(self, bot_name, bot_sem)
+
+    def _finish(self, ticket: "Ticket"):
+        elapsed = time.perf_counter() - ticket.started
+        self._service_time = 0.8 * self._service_time + 0.2 * elapsed
+        self.active -= 1
+        if self.controller is not None:
+            self.controller.inflight -= 1
+        self._sem.release()
+        ticket.bot_sem.release()
+        self._release_bot(ticket.bot_name)
+        self._gauges()
+        metrics.observe("admission_service_seconds", elapsed, pool=self.name)
+
+    @asynccontextmanager
+    async def admit(self, bot_name: str, reject: bool = True):
+        ticket = await self.acquire(bot_name, reject=reject)
+        try:
+            yield ticket
+        finally:
+            ticket.release()
+
+    def _release_bot(self, bot_name: str):
+        pending = self._bot_pending.get(bot_name, 1) - 1
+        if pending <= 0:
+            self._bot_pending.pop(bot_name, None)
+            self._bot_sems.pop(bot_name, None)
+        else:
+            self._bot_pending[bot_name] = pending
+
+    async def run(self, bot_name: str, fn: Callable, *args, reject: bool = True):
+        """
+        Admit, then run the blocking `fn(*args)` on this pool's threads.
+        """
+        async with self.admit(bot_name, reject=reject):
+            return await anyio.to_thread.run_sync(fn, *args, limiter=self.limiter)
+
+
+class Ticket:
+    """
+    An admitted request's slot. `release()` is idempotent so it can be called
+    from both a streaming body's cleanup and a response background task. It
+    must run on the event loop: asyncio semaphores are not thread-safe.
+    """
+
+    def __init__(self, pool: WorkPool, bot_name: str, bot_sem: asyncio.Semaphore):
+        self.pool = pool
+        self.bot_name = bot_name
+        self.bot_sem = bot_sem
+        self.started = time.perf_counter()
+        self.released = False
+
+    def release(self):
+        if not self.released:
+            self.released = True
+            self.pool._finish(self)
+
+
+class AdmissionController:
+    """
+    The set of work pools plus a process-wide cap on in-flight requests.
+    """
+
+    def __init__(self, global_limit: int = None):
+        self.global_limit = global_limit or int(os.getenv("GLOBAL_MAX_INFLIGHT", "64"))
+        self.inflight = 0
+        self.pools: Dict[str, WorkPool] = {}
+
+    def saturated(self) -> bool:
+        return self.inflight >= self.global_limit
+
+    def add_pool(self, name: str, max_concurrency: int, max_queue: int, per_bot_limit: int, max_wait: float = 30.0) -> WorkPool:
+        pool = WorkPool(name, max_concurrency, max_queue, per_bot_limit, max_wait, controller=self)
+        self.pools[name] = pool
+        return pool
+
+    def __getitem__(self, name: str) -> WorkPool:
+        return self.pools[name]
+
+
+def default_admission() -> AdmissionController:
+    """
+    Pools sized from the environment:
+    {CHAT,STREAM,INGEST}_MAX_CONCURRENCY, {CHAT,STREAM,INGEST}_MAX_QUEUE and
+    BOT_MAX_CONCURRENCY (per bot, per pool).
+    """
+    def env(name: str, default: int) -> int:
+        return int(os.getenv(name, str(default)))
+
+    per_bot = env("BOT_MAX_CONCURRENCY", 4)
+    controller = AdmissionController()
+    controller.add_pool("chat", env("CHAT_MAX_CONCURRENCY", 32), env("CHAT_MAX_QUEUE", 64), per_bot)
+    controller.add_pool("stream", env("STREAM_MAX_CONCURRENCY", 16), env("STREAM_MAX_QUEUE", 32), per_bot)
+    # Index builds are CPU heavy; one per bot at a time
+    controller.add_pool("ingest", env("INGEST_MAX_CONCURRENCY", 2), env("INGEST_MAX_QUEUE", 8), 1, max_wait=120.0)
+    return controller
+
+
+if __name__ == '__main__':
+    print('done')
@@ -0,0 +1,120 @@
+import os
+import json
+import hashlib
+import threading
+from typing import Dict, List, Optional, Tuple
+
+import pandas as pd
+
+from core.utils.metrics import metrics
+
+
+Signature = Optional[Tuple[int, int]]  # (mtime_ns, size) of schedule.csv
+
+
+def file_signature(path: str) -> Signature:
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return stat.st_mtime_ns, stat.st_size
+
+
+class BotAvailability:
+    __slots__ = ("months", "signature")
+
+    def __init__(self, months: Dict[str, Dict[str, List[int]]], signature: Signature):
+        self.months = months  # "YYYY-MM" -> {"YYYY-MM-DD": [total, free]}
+        self.signature = signature
+
+
+class AvailabilityIndex:
+    """
+    Per-day free/total slot counters for every bot's schedule, so a calendar
+    view does not scan schedule.csv on each page load.
+
+    Counters are rebuilt from the DataFrame on schedule upload and decremented
+    on each booking. Each entry remembers the schedule file's (mtime, size);
+    if the file changed some other way (another worker, a manual edit) the
+    next read rebuilds it with one scan.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._bots: Dict[str, BotAvailability] = {}
+
+    @staticmethod
+    def _count(df: pd.DataFrame) -> Dict[str, Dict[str, List[int]]]:
+        months: Dict[str, Dict[str, List[int]]] = {}
+        if df.empty:
+            return months
+        free = (df["is_booked"] == False)  # same test as list_free_slots
+        counts = pd.DataFrame({"date": df["date"].astype(str), "free": free}).groupby("date")["free"].agg(["size", "sum"])
+        for date, (total, n_free) in counts.iterrows():
+            months.setdefault(date[:7], {})[date] = [int(total), int(n_free)]
+        return months
+
+    def rebuild(self, bot_name: str, df: pd.DataFrame, schedule_path: str):
+        """
+        Recount a bot's schedule after `df` was written to `schedule_path`.
+        """
+        entry = BotAvailability(self._count(df), file_signature(schedule_path))
+        with self._lock:
+            self._bots[bot_name] = entry
+        metrics.inc("availability_updates_total", kind="rebuild")
+
+    def record_booking(self, bot_name: str, date: str, before: Signature, schedule_path: str):
+        """
+        One slot on `date` was booked. `before` is the schedule's signature
+        read before the booking; a stale entry is dropped instead of patched.
+        """
+        with self._lock:
+            entry = self._bots.get(bot_name)
+            if entry is None:
+                return
+            day = entry.months.get(date[:7], {}).get(date)
+            if entry.signature != before or day is None:
+                del self._bots[bot_name]
+                return
+            day[1] = max(0, day[1] - 1)
+            entry.signature = file_signature(schedule_path)
+        metrics.inc("availability_updates_total", kind="booking")
+
+    def invalidate(self, bot_name: str):
+        with self._lock:
+            self._bots.pop(bot_name, None)
+
+    def month(self, bot_name: str, month: str, schedule_path: str) -> List[dict]:
+        """
+        [{"date", "free", "total"}] for every scheduled day of `month` ("YYYY-MM").
+        """
+        signature = file_signature(schedule_path)
+        with self._lock:
+            entry = self._bots.get(bot_name)
+        if entry is None or entry.signature != signature:
+            with metrics.span("csv:read", bot=bot_name):
+                df = pd.read_csv(schedule_path)
+            # Signature taken before the read: a concurrent write forces another rebuild later
+            entry = BotAvailability(self._count(df), signature)
+            with self._lock:
+                self._bots[bot_name] = entry
+            metrics.inc("availability_updates_total", kind="scan")
+
+        with self._lock:
+            days = entry.months.get(month, {})
+            return [{"date": date, "free": days[date][1], "total": days[date][0]} for date in sorted(days)]
+
+    @staticmethod
+    def etag(bot_name: str, month: str, days: List[dict]) -> str:
+        """
+        Content-derived, so every worker returns the same tag for the same counts.
+        """
+        payload = json.dumps([bot_name, month, days], separators=(",", ":"))
+        return '"' + hashlib.sha1(payload.encode("utf-8")).hexdigest() + '"'
+
+
+availability = AvailabilityIndex()
+
+
+if __name__ == '__main__':
+    print('done')
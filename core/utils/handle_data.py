@@ -1,39 +1,184 @@
 import os
 import json
-import pandas as pd
+import uuid
+import shutil
+import hashlib
+from typing import Dict, Iterator
+
+SCHEDULE_COLUMNS = ["date", "time", "is_booked", "patient_name"]
+LAYOUT_FILE = ".layout.json"
+
+# Sharded layout: bots_data/<h[0:2]>/<h[2:4]>/<bot_id>/ with h = sha1(bot_id).
+# Two levels of 256 keep every directory small well past a million bots.
+SHARD_LEVELS = 2
+SHARD_WIDTH = 2
+
+
+def shard_parts(bot_name: str, levels: int = SHARD_LEVELS, width: int = SHARD_WIDTH) -> list:
+    digest = hashlib.sha1(bot_name.encode("utf-8")).hexdigest()
+    return [digest[i * width:(i + 1) * width] for i in range(levels)]
+
+
+def is_shard_dir(name: str, width: int = SHARD_WIDTH) -> bool:
+    return len(name) == width and all(c in "0123456789abcdef" for c in name)
 
-import os
-import json
-import pandas as pd
 
 class HandleData:
-    def __init__(self):
-        self.BASE_DIR = "bots_data"
+    """
+    Every on-disk path of a bot: its data folder (meta.json, schedule.csv,
+    documents/) under BOTS_DATA_DIR and its index folder under VECTOR_STORE_DIR.
+
+    The layout is recorded in `<BOTS_DATA_DIR>/.layout.json` when the first
+    bot is created. A new data directory is sharded; an existing one without
+    the marker is flat and stays so until
+    `python -m core.utils.migrate_layout` moves it. In the sharded layout a
+    bot not found in its shard is looked up in the flat location, so a
+    partly migrated tree keeps working.
+    """
+
+    def __init__(self, base_dir: str = None, vector_root: str = None):
+        self.BASE_DIR = base_dir or os.getenv("BOTS_DATA_DIR", "bots_data")
+        self.VECTOR_ROOT = vector_root or os.getenv("VECTOR_STORE_DIR", "vector_store")
+        self.layout = self._read_layout()
+        self._flat_fallback = self._needs_flat_fallback()
+        self._shard_dirs = set()
+
+    def _needs_flat_fallback(self) -> bool:
+        """
+        Only a partly migrated tree still has bot folders at the top level.
+        """
+        if self.layout != "sharded":
+            return False
+        for root in (self.BASE_DIR, self.VECTOR_ROOT):
+            if os.path.isdir(root) and any(
+                not name.startswith(".") and not is_shard_dir(name) for name in os.listdir(root)
+            ):
+                return True
+        return False
+
+    def _read_layout(self) -> str:
+        path = os.path.join(self.BASE_DIR, LAYOUT_FILE)
+        if os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                return json.load(f)["layout"]
+
+        # No marker: an existing data directory predates sharding
+        fresh = not os.path.isdir(self.BASE_DIR) or not any(
+            not name.startswith(".") for name in os.listdir(self.BASE_DIR)
+        )
+        return "sharded" if fresh else "flat"
+
+    def write_layout(self, layout: str):
+        os.makedirs(self.BASE_DIR, exist_ok=True)
+        with open(os.path.join(self.BASE_DIR, LAYOUT_FILE), "w", encoding="utf-8") as f:
+            json.dump({"layout": layout, "levels": SHARD_LEVELS, "width": SHARD_WIDTH}, f)
+        self.layout = layout
+        self._flat_fallback = self._needs_flat_fallback()
+
+    def _resolve(self, root: str, bot_name: str) -> str:
+        flat = os.path.join(root, bot_name)
+        if self.layout != "sharded":
+            return flat
+        sharded = os.path.join(root, *shard_parts(bot_name), bot_name)
+        if self._flat_fallback and not os.path.exists(sharded) and os.path.exists(flat):
+            return flat
+        return sharded
+
+    def _make_parent(self, path: str):
+        parent = os.path.dirname(path)
+        if parent not in self._shard_dirs:
+            os.makedirs(parent, exist_ok=True)
+            self._shard_dirs.add(parent)
 
     def get_bot_folder(self, bot_name: str) -> str:
-        return os.path.join(self.BASE_DIR, bot_name)
-    
+        return self._resolve(self.BASE_DIR, bot_name)
+
+    def get_index_dir(self, bot_name: str) -> str:
+        return self._resolve(self.VECTOR_ROOT, bot_name)
+
     def get_schedule_path(self, bot_name: str) -> str:
         return os.path.join(self.get_bot_folder(bot_name), "schedule.csv")
 
     def get_meta_path(self, bot_name: str) -> str:
         return os.path.join(self.get_bot_folder(bot_name), "meta.json")
-    
-    def savejson(self, bot_name: str, bot_data: dict) -> str:
-        bot_folder = self.get_bot_folder(bot_name)
+
+    def get_documents_folder(self, bot_name: str) -> str:
+        return os.path.join(self.get_bot_folder(bot_name), "documents")
+
+    def bot_exists(self, bot_name: str) -> bool:
+        return os.path.exists(self.get_bot_folder(bot_name))
+
+    def iter_bots(self, root: str = None) -> Iterator[str]:
+        """
+        Names of all bot folders under `root` (default: BOTS_DATA_DIR), in either layout.
+        """
+        root = root or self.BASE_DIR
+        if not os.path.isdir(root):
+            return
+
+        def walk(path: str, depth: int):
+            with os.scandir(path) as entries:
+                for entry in entries:
+                    if entry.name.startswith(".") or not entry.is_dir():
+                        continue
+                    if depth < SHARD_LEVELS and is_shard_dir(entry.name):
+                        yield from walk(entry.path, depth + 1)
+                    else:
+                        yield entry.name
+
+        yield from walk(root, 0)
+
+    def _ensure_layout_marker(self):
+        # Written with the first bot, so later processes see the same layout
+        if not os.path.exists(os.path.join(self.BASE_DIR, LAYOUT_FILE)):
+            self.write_layout(self.layout)
+
+    def _write_bot(self, bot_folder: str, bot_data: dict):
         os.makedirs(bot_folder, exist_ok=True)  # ✅ Create full bot folder path
 
-        # ✅ Save empty schedule
-        schedule_path = self.get_schedule_path(bot_name)
-        pd.DataFrame(columns=["date", "time", "is_booked", "patient_name"]).to_csv(schedule_path, index=False)
+        # ✅ Save empty schedule (header only; no DataFrame needed)
+        with open(os.path.join(bot_folder, "schedule.csv"), "w", encoding="utf-8") as f:
+            f.write(",".join(SCHEDULE_COLUMNS) + "\n")
 
         # ✅ Save metadata
-        with open(self.get_meta_path(bot_name), "w") as f:
+        with open(os.path.join(bot_folder, "meta.json"), "w") as f:
             json.dump(bot_data, f, indent=2)
 
+    def savejson(self, bot_name: str, bot_data: dict) -> str:
+        self._ensure_layout_marker()
+        self._write_bot(self.get_bot_folder(bot_name), bot_data)
         return "data saved"
 
+    def create_bots(self, bots: Dict[str, dict]) -> list:
+        """
+        Create many bots all-or-nothing. Every folder is first written under
+        a staging directory, then renamed into place. If anything fails, the
+        staged and already-renamed folders are removed again.
+        """
+        self._ensure_layout_marker()
+        staging = os.path.join(self.BASE_DIR, ".staging", uuid.uuid4().hex)
+        created = []
+        try:
+            for bot_name, bot_data in bots.items():
+                if self.bot_exists(bot_name):
+                    raise FileExistsError(f"Bot '{bot_name}' already exists.")
+                self._write_bot(os.path.join(staging, bot_name), bot_data)
+
+            for bot_name in bots:
+                target = self.get_bot_folder(bot_name)
+                self._make_parent(target)
+                os.rename(os.path.join(staging, bot_name), target)
+                created.append(target)
+        except BaseException:
+            for target in created:
+                shutil.rmtree(target, ignore_errors=True)
+            raise
+        finally:
+            shutil.rmtree(staging, ignore_errors=True)
+
+        return list(bots)
+
 
 
 if __name__ == '__main__':
-    print('done')
\ No newline at end of file
+    print('done')
@@ -0,0 +1,151 @@
+import os
+import time
+import heapq
+import threading
+from typing import Dict, Optional, Set, Tuple
+
+from core.utils.metrics import metrics
+
+
+SlotKey = Tuple[str, str, str]  # (bot_name, date, time)
+
+
+class SlotHold:
+    __slots__ = ("holder", "expires_at", "row")
+
+    def __init__(self, holder: str, expires_at: float, row: Optional[int]):
+        self.holder = holder
+        self.expires_at = expires_at
+        self.row = row
+
+
+class SlotHoldStore:
+    """
+    In-memory, short-lived reservations of schedule slots.
+
+    A slot that `check_availability_tool` reports free is held for the
+    asking session for `ttl` seconds, so it cannot be booked by anyone else
+    while the agent collects the patient's name. Each session holds at most
+    one slot per bot; holding another releases the previous one.
+
+    Expiry is lazy: a min-heap of expiry times is swept on every access,
+    so each expired hold is removed once, in O(log n).
+    """
+
+    def __init__(self, ttl: float = None):
+        self.ttl = ttl if ttl is not None else float(os.getenv("SLOT_HOLD_TTL", "300"))
+        self._lock = threading.Lock()
+        self._holds: Dict[SlotKey, SlotHold] = {}
+        self._by_holder: Dict[Tuple[str, str], SlotKey] = {}
+        self._by_bot: Dict[str, Set[SlotKey]] = {}
+        self._heap = []
+
+    def _sweep(self, now: float):
+        while self._heap and self._heap[0][0] <= now:
+            expires_at, key = heapq.heappop(self._heap)
+            hold = self._holds.get(key)
+            if hold is not None and hold.expires_at == expires_at:
+                self._remove(key, hold)
+                metrics.inc("slot_holds_total", result="expired")
+
+    def _remove(self, key: SlotKey, hold: SlotHold):
+        del self._holds[key]
+        bot_name = key[0]
+        if self._by_holder.get((bot_name, hold.holder)) == key:
+            del self._by_holder[(bot_name, hold.holder)]
+        slots = self._by_bot.get(bot_name)
+        if slots is not None:
+            slots.discard(key)
+            if not slots:
+                del self._by_bot[bot_name]
+        metrics.set_gauge("slot_holds_active", len(self._holds))
+
+    def hold(self, bot_name: str, date: str, time_str: str, holder: str, row: Optional[int] = None) -> bool:
+        """
+        Hold (or refresh) a slot for `holder`. Returns False if someone else holds it.
+        `row` is the slot's schedule row index, remembered for `take`.
+        """
+        key = (bot_name, date, time_str)
+        now = time.monotonic()
+        with self._lock:
+            self._sweep(now)
+            existing = self._holds.get(key)
+            if existing is not None and existing.holder != holder:
+                metrics.inc("slot_holds_total", result="conflict")
+                return False
+
+            previous = self._by_holder.get((bot_name, holder))
+            if previous is not None and previous != key:
+                self._remove(previous, self._holds[previous])
+                metrics.inc("slot_holds_total", result="replaced")
+
+            hold = SlotHold(holder, now + self.ttl, row)
+            self._holds[key] = hold
+            self._by_holder[(bot_name, holder)] = key
+            self._by_bot.setdefault(bot_name, set()).add(key)
+            heapq.heappush(self._heap, (hold.expires_at, key))
+            metrics.inc("slot_holds_total", result="held")
+            metrics.set_gauge("slot_holds_active", len(self._holds))
+            return True
+
+    def holder_of(self, bot_name: str, date: str, time_str: str) -> Optional[str]:
+        with self._lock:
+            self._sweep(time.monotonic())
+            hold = self._holds.get((bot_name, date, time_str))
+            return hold.holder if hold else None
+
+    def is_held_by_other(self, bot_name: str, date: str, time_str: str, holder: str) -> bool:
+        current = self.holder_of(bot_name, date, time_str)
+        return current is not None and current != holder
+
+    def held_by_others(self, bot_name: str, holder: str) -> Set[Tuple[str, str]]:
+        """
+        (date, time) pairs of this bot currently held by other sessions.
+        """
+        with self._lock:
+            self._sweep(time.monotonic())
+            return {
+                (key[1], key[2])
+                for key in self._by_bot.get(bot_name, ())
+                if self._holds[key].holder != holder
+            }
+
+    def take(self, bot_name: str, date: str, time_str: str, holder: str) -> Optional[SlotHold]:
+        """
+        Convert `holder`'s hold into a booking: remove and return it in O(1),
+        or None if `holder` does not hold this slot.
+        """
+        key = (bot_name, date, time_str)
+        with self._lock:
+            self._sweep(time.monotonic())
+            hold = self._holds.get(key)
+            if hold is None or hold.holder != holder:
+                return None
+            self._remove(key, hold)
+            metrics.inc("slot_holds_total", result="converted")
+            return hold
+
+    def release_holder(self, bot_name: str, holder: str):
+        """
+        Drop `holder`'s hold on this bot, e.g. when its conversation is evicted.
+        """
+        with self._lock:
+            key = self._by_holder.get((bot_name, holder))
+            if key is not None:
+                self._remove(key, self._holds[key])
+                metrics.inc("slot_holds_total", result="released")
+
+    def release_bot(self, bot_name: str):
+        """
+        Drop every hold of a bot, e.g. after its schedule was replaced.
+        """
+        with self._lock:
+            for key in list(self._by_bot.get(bot_name, ())):
+                self._remove(key, self._holds[key])
+
+
+slot_holds = SlotHoldStore()
+
+
+if __name__ == '__main__':
+    print('done')
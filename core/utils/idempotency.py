@@ -0,0 +1,93 @@
+import os
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future
+from typing import Any, Callable, Tuple
+
+from core.utils.metrics import metrics
+
+
+class IdempotencyConflict(Exception):
+    """The idempotency key was already used with a different request body."""
+
+
+def fingerprint(*parts: Any) -> str:
+    return hashlib.sha256("\x1f".join(str(p) for p in parts).encode("utf-8")).hexdigest()
+
+
+class IdempotencyCache:
+    """
+    Deduplicates retried requests by idempotency key.
+
+    - A duplicate that arrives while the first request is still running
+      waits for that run and gets its result (no second agent run).
+    - A duplicate that arrives after completion is served from a short-TTL
+      result cache.
+    - Failures are not cached, so a retry after an error runs again.
+    """
+
+    def __init__(self, ttl: float = None, max_entries: int = None):
+        self.ttl = ttl if ttl is not None else float(os.getenv("IDEMPOTENCY_TTL", "600"))
+        self.max_entries = max_entries or int(os.getenv("IDEMPOTENCY_MAX_ENTRIES", "10000"))
+        self._lock = threading.Lock()
+        self._inflight = {}
+        self._done = OrderedDict()
+
+    def _evict(self, now: float):
+        while self._done:
+            key, (_, expires_at, _) = next(iter(self._done.items()))
+            if expires_at > now and len(self._done) <= self.max_entries:
+                break
+            del self._done[key]
+
+    def run(self, key: str, request_fingerprint: str, fn: Callable[[], Any]) -> Tuple[Any, str]:
+        """
+        Run `fn` once per key. Returns (result, status), where status is
+        "miss" (ran now), "inflight" (joined a running call) or "cached".
+        """
+        now = time.monotonic()
+        with self._lock:
+            self._evict(now)
+
+            done = self._done.get(key)
+            if done is not None:
+                self._check(key, done[0], request_fingerprint)
+                metrics.inc("idempotency_requests_total", result="cached")
+                return done[2], "cached"
+
+            inflight = self._inflight.get(key)
+            if inflight is not None:
+                self._check(key, inflight[0], request_fingerprint)
+                future, status = inflight[1], "inflight"
+            else:
+                future, status = Future(), "miss"
+                self._inflight[key] = (request_fingerprint, future)
+
+        metrics.inc("idempotency_requests_total", result=status)
+        if status == "inflight":
+            return future.result(), status
+
+        try:
+            result = fn()
+        except BaseException as e:
+            with self._lock:
+                self._inflight.pop(key, None)
+            future.set_exception(e)
+            raise
+
+        with self._lock:
+            self._inflight.pop(key, None)
+            self._done[key] = (request_fingerprint, time.monotonic() + self.ttl, result)
+        future.set_result(result)
+        return result, status
+
+    def _check(self, key: str, stored: str, given: str):
+        if stored != given:
+            metrics.inc("idempotency_requests_total", result="conflict")
+            raise IdempotencyConflict(f"Idempotency key '{key}' was already used with a different request.")
+
+
+if __name__ == '__main__':
+    print('done')
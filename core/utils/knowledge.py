@@ -0,0 +1,709 @@
+import os
+import json
+import math
+import time
+import heapq
+import shutil
+import pickle
+import hashlib
+import threading
+from collections import Counter, defaultdict
+from typing import Dict, List, Optional
+
+import numpy as np
+from pydantic import Field
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+from langchain_core.callbacks import CallbackManagerForRetrieverRun
+from langchain_community.vectorstores import FAISS
+from langchain_community.docstore.in_memory import InMemoryDocstore
+from langchain.retrievers import EnsembleRetriever
+
+from core.utils.vectordb import (
+    PDFIndexer,
+    bot_retrieval_settings,
+    apply_search_params,
+    build_faiss_index,
+    choose_index_type,
+    get_embedding_model,
+    resolve_backend,
+)
+from core.utils.metrics import metrics
+from core.utils.logger import get_logger
+
+logger = get_logger("knowledge")
+
+# HNSW graphs cannot drop vectors, and IVF-PQ's remove_ids keeps the ids of
+# the remaining vectors (which LangChain's FAISS.delete renumbers). Deleted
+# chunks are hidden until they make up this fraction of the index, then the
+# index is rebuilt.
+TOMBSTONE_COMPACT_RATIO = float(os.getenv("KB_TOMBSTONE_COMPACT_RATIO", "0.2"))
+
+# Changes since the last full snapshot are stored as per-document segments
+# plus a journal. Once the journal covers this fraction of the index's
+# chunks, a new snapshot is written and the journal starts over.
+JOURNAL_COMPACT_RATIO = float(os.getenv("KB_JOURNAL_COMPACT_RATIO", "0.5"))
+
+
+class DocumentNotFound(Exception):
+    """No document with this id in the bot's knowledge base."""
+
+
+def _public(entry: dict) -> dict:
+    return {k: v for k, v in entry.items() if k not in ("ids", "segment")}
+
+
+def document_id(data: bytes) -> str:
+    """
+    Content-addressed id, so re-uploading the same file is a no-op.
+    """
+    return hashlib.sha256(data).hexdigest()[:16]
+
+
+class IncrementalBM25Retriever(BaseRetriever):
+    """
+    BM25 over an inverted index, so chunks can be added and removed in time
+    proportional to those chunks. (`BM25Retriever` computes its statistics
+    once for the whole corpus; every change re-tokenized every chunk.)
+
+    Tokens are whitespace-split like `BM25Retriever`'s default. idf is the
+    non-negative form log(1 + (N - df + 0.5) / (df + 0.5)), and only chunks
+    sharing a term with the query are returned.
+    """
+
+    k: int = 4
+    k1: float = 1.5
+    b: float = 0.75
+    docs: Dict[str, Document] = Field(default_factory=dict)
+    lengths: Dict[str, int] = Field(default_factory=dict)
+    postings: Dict[str, Dict[str, int]] = Field(default_factory=dict)  # term -> {chunk id: tf}
+    total_length: int = 0
+
+    @staticmethod
+    def tokenize(text: str) -> List[str]:
+        return text.split()
+
+    def add(self, ids: List[str], chunks: List[Document]):
+        for chunk_id, chunk in zip(ids, chunks):
+            if chunk_id in self.docs:
+                continue
+            tokens = self.tokenize(chunk.page_content)
+            for term, tf in Counter(tokens).items():
+                self.postings.setdefault(term, {})[chunk_id] = tf
+            self.docs[chunk_id] = chunk
+            self.lengths[chunk_id] = len(tokens)
+            self.total_length += len(tokens)
+
+    def remove(self, ids: List[str]):
+        for chunk_id in ids:
+            chunk = self.docs.pop(chunk_id, None)
+            if chunk is None:
+                continue
+            for term in set(self.tokenize(chunk.page_content)):
+                posting = self.postings.get(term)
+                if posting is not None:
+                    posting.pop(chunk_id, None)
+                    if not posting:
+                        del self.postings[term]
+            self.total_length -= self.lengths.pop(chunk_id)
+
+    def _get_relevant_documents(self, query: str, *, run_manager: CallbackManagerForRetrieverRun) -> List[Document]:
+        n = len(self.lengths)
+        if not n:
+            return []
+        avgdl = self.total_length / n or 1.0
+
+        scores: Dict[str, float] = defaultdict(float)
+        for term in self.tokenize(query):
+            posting = self.postings.get(term)
+            if not posting:
+                continue
+            idf = math.log(1 + (n - len(posting) + 0.5) / (len(posting) + 0.5))
+            for chunk_id, tf in posting.items():
+                norm = self.k1 * (1 - self.b + self.b * self.lengths[chunk_id] / avgdl)
+                scores[chunk_id] += idf * tf * (self.k1 + 1) / (tf + norm)
+
+        top = heapq.nlargest(self.k, scores.items(), key=lambda item: item[1])
+        return [self.docs[chunk_id] for chunk_id, _ in top]
+
+
+class KnowledgeBase:
+    """
+    A bot's document collection: one FAISS store and one BM25 index over the
+    chunks of every document, plus `manifest.json` mapping each document to
+    its chunk ids.
+
+    - Adding a document embeds only that document's chunks and appends them.
+    - Deleting a document removes its vectors by id (flat) or hides them
+      behind a tombstone (HNSW, IVF-PQ) until compaction.
+    - When the index type is "auto" and the corpus outgrows the current type,
+      the index is rebuilt from each document's original vectors, without
+      re-embedding.
+    - The loaded store is kept in memory and reused by every query.
+
+    On disk, `faiss/`, `bm25.pkl` and `manifest.json` are a snapshot. Every
+    add writes the document's chunks and float32 vectors to its own file in
+    `segments/`, kept for as long as the document is indexed; a later add
+    also appends a line to `journal.jsonl`, and each delete appends a line.
+    Loading replays the journal over the snapshot. So an add or delete
+    writes only that document, and the full snapshot is rewritten when the
+    journal grows past `JOURNAL_COMPACT_RATIO` of the index, on an index
+    rebuild, and when the first document is added or the last one deleted.
+    """
+
+    def __init__(self, index_dir: str, settings: Optional[dict] = None):
+        self.index_dir = index_dir
+        self.settings = settings or bot_retrieval_settings(None)
+        self.lock = threading.RLock()
+        self.store: Optional[FAISS] = None
+        self.bm25: Optional[IncrementalBM25Retriever] = None
+        self.manifest: dict = self._empty_manifest()
+        self._journal_chunks = 0  # chunks added or deleted since the snapshot
+        self._loaded_signature = False  # never loaded; None means nothing on disk
+
+    @property
+    def faiss_path(self) -> str:
+        return os.path.join(self.index_dir, "faiss")
+
+    @property
+    def bm25_path(self) -> str:
+        return os.path.join(self.index_dir, "bm25.pkl")
+
+    @property
+    def manifest_path(self) -> str:
+        return os.path.join(self.index_dir, "manifest.json")
+
+    @property
+    def journal_path(self) -> str:
+        return os.path.join(self.index_dir, "journal.jsonl")
+
+    @property
+    def segments_path(self) -> str:
+        return os.path.join(self.index_dir, "segments")
+
+    def segment_path(self, name: str) -> str:
+        return os.path.join(self.segments_path, name)
+
+    def _empty_manifest(self) -> dict:
+        return {"index_type": None, "embedding_backend": None, "documents": {}, "tombstones": {}, "generation": 0}
+
+    def _signature(self):
+        """
+        Changes when another process writes a snapshot or appends to the journal.
+        """
+        snapshot = None
+        for path in (self.manifest_path, os.path.join(self.faiss_path, "index.faiss")):
+            if os.path.exists(path):
+                snapshot = os.stat(path).st_mtime_ns
+                break
+        journal = os.path.getsize(self.journal_path) if os.path.exists(self.journal_path) else 0
+        if snapshot is None and not journal:
+            return None
+        return snapshot, journal
+
+    def _ensure_loaded(self):
+        """
+        (Re)load from disk when another process changed the index since we loaded it.
+        """
+        signature = self._signature()
+        if signature == self._loaded_signature:
+            return
+
+        self.manifest = self._empty_manifest()
+        if os.path.exists(self.manifest_path):
+            with open(self.manifest_path, "r", encoding="utf-8") as f:
+                self.manifest.update(json.load(f))
+        elif os.path.exists(self.faiss_path):
+            self.manifest.update(PDFIndexer().load_index_config(self.index_dir))
+
+        self.store, self.bm25 = None, None
+        if os.path.exists(self.faiss_path):
+            with metrics.span("retrieval:load", index_dir=self.index_dir):
+                backend = self.manifest.get("embedding_backend") or "torch"
+                self.store = FAISS.load_local(
+                    self.faiss_path, embeddings=get_embedding_model(backend), allow_dangerous_deserialization=True
+                )
+                apply_search_params(self.store.index, self.manifest.get("index_type") or "flat")
+                if os.path.exists(self.bm25_path):
+                    with open(self.bm25_path, "rb") as f:
+                        self.bm25 = pickle.load(f)
+
+            if not self.manifest["documents"] and self.store.index.ntotal:
+                self._adopt_legacy_index()
+            if not isinstance(self.bm25, IncrementalBM25Retriever):
+                # Indexes saved with a corpus-wide `BM25Retriever`: index the live chunks once
+                self.bm25 = self._new_bm25(self._live_chunks())
+
+        self._journal_chunks = 0
+        self._replay()
+        self._loaded_signature = signature
+
+    def _adopt_legacy_index(self):
+        """
+        An index built from a single context.pdf before documents were
+        tracked becomes the "context" document.
+        """
+        ids = [self.store.index_to_docstore_id[i] for i in sorted(self.store.index_to_docstore_id)]
+        for chunk_id in ids:
+            self.store.docstore.search(chunk_id).metadata["doc_id"] = "context"
+        self.manifest["documents"]["context"] = {
+            "doc_id": "context",
+            "filename": "context.pdf",
+            "chunks": len(ids),
+            "ids": ids,
+            "added_at": None,
+        }
+        self.manifest["index_type"] = self.manifest.get("index_type") or "flat"
+        self.manifest["embedding_backend"] = self.manifest.get("embedding_backend") or "torch"
+
+    def _new_bm25(self, chunks: List[Document]) -> Optional[IncrementalBM25Retriever]:
+        if not chunks:
+            return None
+        with metrics.span("ingest:bm25", index_dir=self.index_dir, chunks=len(chunks)):
+            bm25 = IncrementalBM25Retriever()
+            bm25.add([c.metadata.get("chunk_id") or str(i) for i, c in enumerate(chunks)], chunks)
+        return bm25
+
+    def list_documents(self) -> List[dict]:
+        with self.lock:
+            self._ensure_loaded()
+            return [_public(doc) for doc in self.manifest["documents"].values()]
+
+    def has_document(self, doc_id: str) -> bool:
+        with self.lock:
+            self._ensure_loaded()
+            return doc_id in self.manifest["documents"]
+
+    def add_document(self, doc_id: str, filename: str, pdf_path: str, split: bool = True) -> dict:
+        """
+        Chunk and embed one PDF and append it to the index. The cost is
+        proportional to this document; existing vectors are not touched.
+        """
+        if self.has_document(doc_id):
+            return _public(self.manifest["documents"][doc_id])
+
+        backend = self.manifest.get("embedding_backend") or resolve_backend(self.settings["embedding_backend"])
+        # Embedding is the expensive part and needs no lock
+        entry, chunks, vectors = self._prepare(doc_id, filename, pdf_path, backend, split)
+
+        with self.lock:
+            self._ensure_loaded()
+            if doc_id in self.manifest["documents"]:
+                return _public(self.manifest["documents"][doc_id])
+
+            snapshot = self.store is None
+            entry["added_at"] = time.strftime("%Y-%m-%dT%H:%M:%S")
+            entry["segment"] = self._write_segment(doc_id, entry["ids"], chunks, vectors)
+            if doc_id in self.manifest["tombstones"]:
+                # Re-added after an HNSW/IVF-PQ delete: its old chunks (same ids) are
+                # still in the index and docstore, so compact them away first.
+                self._rebuild(self.manifest["index_type"])
+                snapshot = True
+
+            if self.store is None and chunks:
+                self.manifest["embedding_backend"] = backend
+            with metrics.span("ingest:faiss", index_dir=self.index_dir, chunks=len(chunks)) as span:
+                self._apply_add(entry, chunks, vectors)
+                if chunks and self._maybe_promote():
+                    snapshot = True
+                span.set(index_type=self.manifest["index_type"])
+
+            if snapshot or self._journal_full(len(chunks)):
+                self._snapshot()
+            else:
+                self._append_journal({"op": "add", "entry": entry}, len(chunks))
+            metrics.inc("kb_documents_total", op="add")
+
+        logger.info("Added document %s (%s, %d chunks) to %s", doc_id, filename, len(chunks), self.index_dir)
+        return _public(entry)
+
+    def _prepare(self, doc_id: str, filename: str, pdf_path: str, backend: str, split: bool = True):
+        """
+        Chunk and embed one PDF with the current settings. Returns (entry, chunks, vectors).
+        """
+        settings = dict(self.settings)
+        settings.pop("top_k", None)  # a query setting, not an indexer one
+        settings["embedding_backend"] = backend
+        indexer = PDFIndexer(**settings)
+        indexer.set_path(pdf_path=pdf_path, index_dir=self.index_dir)
+
+        with metrics.span("ingest:extract", index_dir=self.index_dir, doc_id=doc_id):
+            chunks = indexer.extract_pdf_text(split=split)
+        ids = [f"{doc_id}:{i}" for i in range(len(chunks))]
+        for chunk_id, chunk in zip(ids, chunks):
+            chunk.metadata["doc_id"] = doc_id
+            chunk.metadata["chunk_id"] = chunk_id
+            chunk.metadata["filename"] = filename
+
+        with metrics.span("ingest:embed", index_dir=self.index_dir, chunks=len(chunks)):
+            vectors = indexer.embedding_model.embed_documents([c.page_content for c in chunks]) if chunks else []
+
+        entry = {
+            "doc_id": doc_id,
+            "filename": filename,
+            "chunks": len(chunks),
+            "chunk_size": indexer.chunk_size,
+            "chunk_overlap": indexer.chunk_overlap,
+            "ids": ids,
+            "added_at": None,
+        }
+        return entry, chunks, np.asarray(vectors, dtype="float32")
+
+    def reindex(self, pdf_paths: Dict[str, str]) -> List[dict]:
+        """
+        Re-chunk and re-embed the documents in `pdf_paths` (doc_id -> PDF)
+        with the current settings and build a fresh index. Other documents
+        keep their chunks and the original vectors from their segments.
+        """
+        with self.lock:
+            self._ensure_loaded()
+            documents = dict(self.manifest["documents"])
+            carried = set(documents) - set(pdf_paths)
+            if carried and self.manifest.get("embedding_backend"):
+                backend = self.manifest["embedding_backend"]  # kept vectors fix the backend
+            else:
+                backend = resolve_backend(self.settings["embedding_backend"])
+
+        prepared = {
+            doc_id: self._prepare(doc_id, documents[doc_id]["filename"], path, backend)
+            for doc_id, path in pdf_paths.items() if doc_id in documents
+        }
+
+        with self.lock:
+            self._ensure_loaded()
+            entries, chunks, vectors = [], [], []
+            for doc_id, old in self.manifest["documents"].items():
+                if doc_id in prepared:
+                    entry, doc_chunks, doc_vectors = prepared[doc_id]
+                    entry["added_at"] = old.get("added_at")
+                    entry["segment"] = self._write_segment(doc_id, entry["ids"], doc_chunks, doc_vectors)
+                else:
+                    entry = old
+                    doc_chunks = [self.store.docstore.search(i) for i in old["ids"]]
+                    doc_vectors = self._document_vectors(old) if old["ids"] else None
+                entries.append(entry)
+                if doc_chunks:
+                    chunks.extend(doc_chunks)
+                    vectors.append(doc_vectors)
+
+            self.store, self.bm25 = None, None
+            self.manifest.update({"embedding_backend": backend, "tombstones": {}, "documents": {}})
+            with metrics.span("ingest:reindex", index_dir=self.index_dir, chunks=len(chunks)):
+                if chunks:
+                    ids = [i for entry in entries for i in entry["ids"]]
+                    self.store = self._new_store(np.vstack(vectors).astype("float32"), chunks, ids)
+                    self.bm25 = IncrementalBM25Retriever()
+                    self.bm25.add(ids, chunks)
+            self.manifest["documents"] = {entry["doc_id"]: entry for entry in entries}
+            self._snapshot()
+
+        logger.info("Re-indexed %d documents in %s", len(prepared), self.index_dir)
+        return [_public(prepared[doc_id][0]) for doc_id in prepared]
+
+    def delete_document(self, doc_id: str):
+        """
+        Remove one document's chunks from the index.
+        """
+        with self.lock:
+            self._ensure_loaded()
+            if doc_id not in self.manifest["documents"]:
+                raise DocumentNotFound(f"Document '{doc_id}' not found.")
+
+            with metrics.span("ingest:delete", index_dir=self.index_dir, doc_id=doc_id):
+                entry = self._apply_delete(doc_id)
+
+            snapshot = self.store is None
+            hidden = sum(len(v) for v in self.manifest["tombstones"].values())
+            if self.store is not None and hidden > TOMBSTONE_COMPACT_RATIO * self.store.index.ntotal:
+                self._rebuild(self.manifest["index_type"])
+                snapshot = True
+
+            if snapshot or self._journal_full(len(entry["ids"])):
+                self._snapshot()
+            else:
+                self._append_journal({"op": "delete", "doc_id": doc_id}, len(entry["ids"]))
+            metrics.inc("kb_documents_total", op="delete")
+
+        logger.info("Deleted document %s from %s", doc_id, self.index_dir)
+
+    def _apply_add(self, entry: dict, chunks: List[Document], vectors: np.ndarray):
+        """
+        Add a document's chunks to the in-memory store, BM25 index and manifest.
+        """
+        ids = entry["ids"]
+        if chunks:
+            if self.store is None:
+                self.store = self._new_store(vectors, chunks, ids)
+            else:
+                self.store.add_embeddings(
+                    zip([c.page_content for c in chunks], vectors.tolist()),
+                    metadatas=[c.metadata for c in chunks],
+                    ids=ids,
+                )
+            if self.bm25 is None:
+                self.bm25 = IncrementalBM25Retriever()
+            self.bm25.add(ids, chunks)
+        self.manifest["documents"][entry["doc_id"]] = entry
+
+    def _apply_delete(self, doc_id: str) -> dict:
+        """
+        Remove a document from the in-memory store, BM25 index and manifest.
+        """
+        entry = self.manifest["documents"].pop(doc_id)
+        if not self.manifest["documents"]:
+            self.store, self.bm25 = None, None
+        elif entry["ids"]:
+            if self.manifest["index_type"] == "flat":
+                self.store.delete(entry["ids"])
+            else:
+                self.manifest["tombstones"][doc_id] = entry["ids"]
+            self.bm25.remove(entry["ids"])
+        return entry
+
+    def _new_store(self, vectors: np.ndarray, chunks: List[Document], ids: List[str]) -> FAISS:
+        index_type = choose_index_type(len(chunks), self.settings["index_type"])
+        store = FAISS(
+            embedding_function=get_embedding_model(self.manifest["embedding_backend"]),
+            index=build_faiss_index(vectors, index_type),
+            docstore=InMemoryDocstore(dict(zip(ids, chunks))),
+            index_to_docstore_id=dict(enumerate(ids)),
+        )
+        self.manifest["index_type"] = index_type
+        return store
+
+    def _maybe_promote(self) -> bool:
+        """
+        Switch index type once the corpus grows past the current type's range.
+        """
+        target = choose_index_type(self.store.index.ntotal, self.settings["index_type"])
+        if target != self.manifest["index_type"] and self.manifest["index_type"] != "ivfpq":
+            logger.info("Promoting %s index in %s to %s", self.manifest["index_type"], self.index_dir, target)
+            self._rebuild(target)
+            return True
+        return False
+
+    def _rebuild(self, index_type: str):
+        """
+        Rebuild the faiss index from the original vectors of live documents
+        (drops tombstones, changes index type). No re-embedding.
+        """
+        with metrics.span("ingest:rebuild", index_dir=self.index_dir, index_type=index_type):
+            live = [entry for entry in self.manifest["documents"].values() if entry["ids"]]
+            if not live:
+                self.store = None
+                self.manifest["tombstones"] = {}
+                return
+            ids = [i for entry in live for i in entry["ids"]]
+            index_type = choose_index_type(len(ids), index_type)  # too few left to train IVF-PQ
+            vectors = np.vstack([self._document_vectors(entry) for entry in live]).astype("float32")
+            self.store = FAISS(
+                embedding_function=self.store.embedding_function,
+                index=build_faiss_index(vectors, index_type),
+                docstore=InMemoryDocstore({i: self.store.docstore.search(i) for i in ids}),
+                index_to_docstore_id=dict(enumerate(ids)),
+            )
+        self.manifest["index_type"] = index_type
+        self.manifest["tombstones"] = {}
+
+    def _document_vectors(self, entry: dict) -> np.ndarray:
+        """
+        A document's original float32 vectors, from its segment. Documents
+        indexed before segments were kept have theirs reconstructed from the
+        faiss index once (lossy for IVF-PQ) and saved as a segment.
+        """
+        if entry.get("segment") and os.path.exists(self.segment_path(entry["segment"])):
+            with open(self.segment_path(entry["segment"]), "rb") as f:
+                segment = pickle.load(f)
+            if segment["ids"] == entry["ids"]:
+                return np.asarray(segment["vectors"], dtype="float32")
+
+        import faiss
+
+        index = self.store.index
+        ivf = faiss.try_extract_index_ivf(index)
+        if ivf is not None and ivf.direct_map.no():
+            ivf.make_direct_map()
+        positions = {chunk_id: p for p, chunk_id in self.store.index_to_docstore_id.items()}
+        vectors = np.vstack([index.reconstruct(int(positions[i])) for i in entry["ids"]]).astype("float32")
+        chunks = [self.store.docstore.search(i) for i in entry["ids"]]
+        entry["segment"] = self._write_segment(entry["doc_id"], entry["ids"], chunks, vectors)
+        return vectors
+
+    def _live_chunks(self) -> List[Document]:
+        hidden = set(self.manifest["tombstones"])
+        chunks = []
+        for chunk_id, doc in self.store.docstore._dict.items():
+            if doc.metadata.get("doc_id") not in hidden:
+                doc.metadata.setdefault("chunk_id", chunk_id)
+                chunks.append(doc)
+        return chunks
+
+    # ---------- persistence ----------
+    def _journal_full(self, chunks: int) -> bool:
+        total = self.store.index.ntotal if self.store is not None else 0
+        return self._journal_chunks + chunks > JOURNAL_COMPACT_RATIO * total
+
+    def _write_segment(self, doc_id: str, ids: List[str], chunks: List[Document], vectors: np.ndarray) -> str:
+        """
+        Store one document's chunks and vectors. Each add gets a new file, so
+        a journal line never refers to a segment a later re-add replaced.
+        """
+        os.makedirs(self.segments_path, exist_ok=True)
+        name = f"{doc_id}.{time.time_ns()}.pkl"
+        path = self.segment_path(name)
+        with open(path + ".tmp", "wb") as f:
+            pickle.dump({"ids": ids, "chunks": chunks, "vectors": vectors}, f)
+        os.replace(path + ".tmp", path)
+        return name
+
+    def _append_journal(self, record: dict, chunks: int):
+        """
+        Record one change. The segment (for adds) is written first, so every
+        journal line refers to a complete segment.
+        """
+        record["generation"] = self.manifest["generation"]
+        with open(self.journal_path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(record) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        self._journal_chunks += chunks
+        self._loaded_signature = self._signature()
+        metrics.inc("kb_journal_writes_total", op=record["op"])
+
+    def _replay(self):
+        """
+        Apply the journal of the current snapshot generation to the loaded snapshot.
+        """
+        if not os.path.exists(self.journal_path):
+            return
+        with open(self.journal_path, "r", encoding="utf-8") as f:
+            lines = f.readlines()
+
+        with metrics.span("retrieval:replay", index_dir=self.index_dir, entries=len(lines)):
+            for line in lines:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    break  # torn final line from an interrupted write
+                if record.get("generation") != self.manifest["generation"]:
+                    continue  # written before the current snapshot
+
+                if record["op"] == "add":
+                    entry = record["entry"]
+                    if entry["doc_id"] in self.manifest["documents"]:
+                        continue
+                    entry.setdefault("segment", f"{entry['doc_id']}.pkl")  # journals from before per-add names
+                    with open(self.segment_path(entry["segment"]), "rb") as seg:
+                        segment = pickle.load(seg)
+                    self._apply_add(entry, segment["chunks"], segment["vectors"])
+                    self._journal_chunks += len(entry["ids"])
+                elif record["op"] == "delete" and record["doc_id"] in self.manifest["documents"]:
+                    entry = self._apply_delete(record["doc_id"])
+                    self._journal_chunks += len(entry["ids"])
+
+    def _snapshot(self):
+        """
+        Persist the whole store, BM25 index and manifest, then drop the
+        journal and the segments of documents no longer indexed. The new
+        FAISS files are written aside and swapped in; the manifest's
+        generation makes a journal left over by an interrupted snapshot
+        ignored on load.
+        """
+        os.makedirs(self.index_dir, exist_ok=True)
+        with metrics.span("ingest:snapshot", index_dir=self.index_dir):
+            if self.store is None:
+                shutil.rmtree(self.faiss_path, ignore_errors=True)
+                if os.path.exists(self.bm25_path):
+                    os.remove(self.bm25_path)
+                self.bm25 = None
+                self.manifest.update({"index_type": None, "tombstones": {}})
+            else:
+                tmp_path = self.faiss_path + ".tmp"
+                self.store.save_local(tmp_path)
+                shutil.rmtree(self.faiss_path, ignore_errors=True)
+                os.replace(tmp_path, self.faiss_path)
+                with open(self.bm25_path + ".tmp", "wb") as f:
+                    pickle.dump(self.bm25, f)
+                os.replace(self.bm25_path + ".tmp", self.bm25_path)
+
+            with open(PDFIndexer().index_config_path(self.index_dir), "w", encoding="utf-8") as f:
+                json.dump({
+                    "index_type": self.manifest["index_type"],
+                    "embedding_backend": self.manifest["embedding_backend"],
+                    "chunks": self.store.index.ntotal if self.store is not None else 0,
+                }, f, indent=2)
+
+            self.manifest["generation"] = self.manifest.get("generation", 0) + 1
+            with open(self.manifest_path + ".tmp", "w", encoding="utf-8") as f:
+                json.dump(self.manifest, f, indent=2)
+            os.replace(self.manifest_path + ".tmp", self.manifest_path)
+
+            if os.path.exists(self.journal_path):
+                os.remove(self.journal_path)
+            live = {entry.get("segment") for entry in self.manifest["documents"].values()}
+            if os.path.isdir(self.segments_path):
+                for name in os.listdir(self.segments_path):
+                    if name not in live:
+                        os.remove(self.segment_path(name))
+        self._journal_chunks = 0
+        self._loaded_signature = self._signature()
+        metrics.inc("kb_snapshots_total")
+
+    def search(self, query: str, top_k: int = None) -> List[dict]:
+        """
+        Hybrid (vector + BM25) retrieval over every live document, fused with
+        the bot's `weights`.
+        """
+        top_k = top_k or self.settings["top_k"]
+        with self.lock:
+            self._ensure_loaded()
+            if self.store is None:
+                return []
+
+            search_kwargs = {"k": top_k}
+            hidden = set(self.manifest["tombstones"])
+            if hidden:
+                search_kwargs["filter"] = lambda metadata: metadata.get("doc_id") not in hidden
+                search_kwargs["fetch_k"] = top_k + sum(len(v) for v in self.manifest["tombstones"].values())
+
+            retrievers = [self.store.as_retriever(search_kwargs=search_kwargs)]
+            if self.bm25 is not None:
+                self.bm25.k = top_k
+                retrievers.append(self.bm25)
+            retriever = EnsembleRetriever(retrievers=retrievers, weights=self.settings["weights"][:len(retrievers)])
+
+            with metrics.span("retrieval", index_dir=self.index_dir, top_k=top_k) as span:
+                results: List[Document] = retriever.invoke(query)
+                span.set(results=len(results))
+
+        return [
+            {
+                "text": doc.page_content,
+                "source": doc.metadata.get("filename") or doc.metadata.get("source", "unknown"),
+                "doc_id": doc.metadata.get("doc_id"),
+            }
+            for doc in results[:top_k]
+        ]
+
+
+_knowledge_bases: Dict[str, KnowledgeBase] = {}
+_knowledge_bases_lock = threading.Lock()
+
+
+def get_knowledge_base(index_dir: str, settings: Optional[dict] = None) -> KnowledgeBase:
+    """
+    Process-wide KnowledgeBase per index directory, so its store stays loaded.
+    `settings` (from `bot_retrieval_settings`) replace the previous ones; chunking
+    settings apply to documents added afterwards.
+    """
+    with _knowledge_bases_lock:
+        kb = _knowledge_bases.get(index_dir)
+        if kb is None:
+            kb = _knowledge_bases[index_dir] = KnowledgeBase(index_dir, settings)
+        elif settings:
+            kb.settings = settings
+        return kb
+
+
+if __name__ == '__main__':
+    print('done')
@@ -0,0 +1,138 @@
+import os
+import sys
+import queue
+import atexit
+import random
+import logging
+import logging.handlers
+from typing import Optional
+
+from core.utils.metrics import metrics
+
+
+ROOT_LOGGER = "appointment_agent"
+LOG_FORMAT = "%(asctime)s %(levelname)s %(name)s: %(message)s"
+
+_listener: Optional[logging.handlers.QueueListener] = None
+
+
+class SamplingFilter(logging.Filter):
+    """
+    Keeps every WARNING and above, and only a `rate` fraction of lower
+    level records, so DEBUG/INFO volume stays bounded under load.
+    """
+
+    def __init__(self, rate: float = 1.0):
+        super().__init__()
+        self.rate = rate
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno >= logging.WARNING or self.rate >= 1.0:
+            return True
+        return random.random() < self.rate
+
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    """
+    QueueHandler that never blocks the caller: when the queue is full the
+    record is dropped and counted instead of waiting for the writer thread.
+    """
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            metrics.inc("log_records_dropped_total")
+
+
+def configure_logging(
+        level: Optional[str] = None,
+        sample_rate: Optional[float] = None,
+        queue_size: int = 10000,
+        handler: Optional[logging.Handler] = None):
+    """
+    Configure the application logger once. Records are handed to a bounded
+    queue and written by a background thread, so request threads and the
+    event loop never wait on stdout.
+
+    Args:
+        level (str): Global level, defaults to $LOG_LEVEL or INFO.
+        sample_rate (float): Fraction of DEBUG/INFO records kept, defaults to $LOG_SAMPLE_RATE or 1.0.
+        queue_size (int): Max records buffered before new ones are dropped.
+        handler (logging.Handler): Final sink, defaults to a stderr StreamHandler.
+    """
+    global _listener
+
+    level = (level or os.getenv("LOG_LEVEL", "INFO")).upper()
+    if sample_rate is None:
+        sample_rate = float(os.getenv("LOG_SAMPLE_RATE", "1.0"))
+
+    root = logging.getLogger(ROOT_LOGGER)
+    root.setLevel(level)
+    root.propagate = False
+
+    if _listener is not None:
+        _listener.stop()
+    for existing in list(root.handlers):
+        root.removeHandler(existing)
+
+    if handler is None:
+        handler = logging.StreamHandler(sys.stderr)
+        handler.setFormatter(logging.Formatter(LOG_FORMAT))
+
+    log_queue = queue.Queue(maxsize=queue_size)
+    queue_handler = DroppingQueueHandler(log_queue)
+    queue_handler.addFilter(SamplingFilter(sample_rate))
+    root.addHandler(queue_handler)
+
+    _listener = logging.handlers.QueueListener(log_queue, handler, respect_handler_level=True)
+    _listener.start()
+    return root
+
+
+def shutdown_logging():
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+def get_logger(name: str) -> logging.Logger:
+    """
+    Return a child of the application logger, configuring logging on first use.
+    """
+    if _listener is None:
+        configure_logging()
+    return logging.getLogger(f"{ROOT_LOGGER}.{name}")
+
+
+def bot_log_settings(config: Optional[dict]) -> dict:
+    """
+    Resolve the logging settings for a bot from the `logging` block of its
+    meta.json, falling back to the global environment defaults.
+
+        "logging": {"level": "DEBUG", "verbose_agent": false, "log_transcripts": false}
+    """
+    settings = dict((config or {}).get("logging") or {})
+    return {
+        "level": (settings.get("level") or os.getenv("LOG_LEVEL", "INFO")).upper(),
+        "verbose_agent": bool(settings.get("verbose_agent", os.getenv("AGENT_VERBOSE", "0") == "1")),
+        "log_transcripts": bool(settings.get("log_transcripts", os.getenv("LOG_TRANSCRIPTS", "0") == "1")),
+    }
+
+
+def get_bot_logger(bot_name: str, config: Optional[dict] = None) -> logging.Logger:
+    """
+    Per-bot logger (`appointment_agent.bots.<bot_name>`) whose level follows
+    the bot's meta.json settings.
+    """
+    logger = get_logger(f"bots.{bot_name}")
+    logger.setLevel(bot_log_settings(config)["level"])
+    return logger
+
+
+atexit.register(shutdown_logging)
+
+
+if __name__ == '__main__':
+    print('done')
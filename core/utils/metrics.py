@@ -0,0 +1,261 @@
+import os
+import json
+import time
+import uuid
+import threading
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Optional, Tuple
+
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+_current_trace: ContextVar = ContextVar("current_trace", default=None)
+_current_span: ContextVar = ContextVar("current_span", default=None)
+
+
+def _label_key(labels: dict) -> Tuple[Tuple[str, str], ...]:
+    return tuple(sorted((k, str(v)) for k, v in labels.items() if v is not None))
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(key: Tuple[Tuple[str, str], ...], extra: Optional[dict] = None) -> str:
+    pairs = list(key) + list((extra or {}).items())
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(str(v))}"' for k, v in pairs) + "}"
+
+
+class RequestTrace:
+    """
+    Per-request accumulator. Every span finished while this trace is bound
+    adds its duration to a stage total (e.g. `llm`, `tool`, `retrieval`).
+    """
+
+    def __init__(self, trace_id: Optional[str] = None):
+        self.trace_id = trace_id or uuid.uuid4().hex[:16]
+        self.started = time.perf_counter()
+        self.stages: Dict[str, float] = {}
+        self.counts: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def add(self, stage: str, seconds: float):
+        with self._lock:
+            self.stages[stage] = self.stages.get(stage, 0.0) + seconds
+            self.counts[stage] = self.counts.get(stage, 0) + 1
+
+    def elapsed(self) -> float:
+        return time.perf_counter() - self.started
+
+    def server_timing(self) -> str:
+        """
+        Render the stage totals as a `Server-Timing` header value.
+        """
+        with self._lock:
+            parts = [
+                f'{stage};dur={seconds * 1000:.1f};desc="{self.counts[stage]} span(s)"'
+                for stage, seconds in sorted(self.stages.items())
+            ]
+        parts.append(f"total;dur={self.elapsed() * 1000:.1f}")
+        return ", ".join(parts)
+
+
+def bind_trace(trace: RequestTrace):
+    return _current_trace.set(trace)
+
+
+def unbind_trace(token):
+    _current_trace.reset(token)
+
+
+def current_trace() -> Optional[RequestTrace]:
+    return _current_trace.get()
+
+
+class Span:
+    """
+    A single timed operation. Use `Metrics.span()` for blocks of code, or
+    `Metrics.start_span()` / `Span.end()` when start and end happen in
+    different callbacks.
+    """
+
+    def __init__(self, registry: "Metrics", name: str, attributes: dict):
+        self.registry = registry
+        self.name = name
+        self.attributes = dict(attributes)
+        self.span_id = uuid.uuid4().hex[:16]
+        parent = _current_span.get()
+        self.parent_id = parent.span_id if parent else None
+        self.trace = _current_trace.get()
+        self.start_time = time.time()
+        self._start = time.perf_counter()
+        self.duration = None
+
+    @property
+    def stage(self) -> str:
+        return self.name.split(":", 1)[0]
+
+    def set(self, **attributes):
+        self.attributes.update(attributes)
+
+    def end(self, error: Optional[BaseException] = None):
+        if self.duration is not None:
+            return
+        self.duration = time.perf_counter() - self._start
+        if error is not None:
+            self.attributes["error"] = f"{type(error).__name__}: {error}"
+        self.registry._finish_span(self)
+
+
+class FileSpanExporter:
+    """
+    Appends finished spans to a local file, one JSON object per line.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        folder = os.path.dirname(path)
+        if folder:
+            os.makedirs(folder, exist_ok=True)
+
+    def export(self, record: dict):
+        line = json.dumps(record, default=str)
+        with self._lock:
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(line + "\n")
+
+
+class Metrics:
+    """
+    Minimal in-process metrics registry (counters, gauges, histograms)
+    with Prometheus text exposition and span tracing.
+    """
+
+    def __init__(self, namespace: str = "appointment_agent", buckets=DEFAULT_BUCKETS):
+        self.namespace = namespace
+        self.buckets = tuple(buckets)
+        self.exporters = []
+        self._lock = threading.Lock()
+        self._counters = {}
+        self._gauges = {}
+        self._histograms = {}
+
+    def _name(self, name: str) -> str:
+        return f"{self.namespace}_{name}" if self.namespace else name
+
+    # ---------- primitives ----------
+    def inc(self, name: str, value: float = 1.0, **labels):
+        key = (self._name(name), _label_key(labels))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0.0) + value
+
+    def set_gauge(self, name: str, value: float, **labels):
+        key = (self._name(name), _label_key(labels))
+        with self._lock:
+            self._gauges[key] = float(value)
+
+    def add_gauge(self, name: str, delta: float, **labels):
+        key = (self._name(name), _label_key(labels))
+        with self._lock:
+            self._gauges[key] = self._gauges.get(key, 0.0) + delta
+
+    def observe(self, name: str, value: float, **labels):
+        key = (self._name(name), _label_key(labels))
+        with self._lock:
+            hist = self._histograms.get(key)
+            if hist is None:
+                hist = self._histograms[key] = [[0] * len(self.buckets), 0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    hist[0][i] += 1
+            hist[1] += value
+            hist[2] += 1
+
+    # ---------- tracing ----------
+    def start_span(self, name: str, **attributes) -> Span:
+        return Span(self, name, attributes)
+
+    @contextmanager
+    def span(self, name: str, **attributes):
+        span = self.start_span(name, **attributes)
+        token = _current_span.set(span)
+        try:
+            yield span
+        except BaseException as e:
+            span.end(error=e)
+            raise
+        finally:
+            _current_span.reset(token)
+            span.end()
+
+    def _finish_span(self, span: Span):
+        self.observe("span_duration_seconds", span.duration, span=span.name)
+        if span.trace is not None:
+            span.trace.add(span.stage, span.duration)
+
+        if not self.exporters:
+            return
+        record = {
+            "trace_id": span.trace.trace_id if span.trace else None,
+            "span_id": span.span_id,
+            "parent_id": span.parent_id,
+            "name": span.name,
+            "start": span.start_time,
+            "duration_ms": round(span.duration * 1000, 3),
+            "attributes": span.attributes,
+        }
+        for exporter in self.exporters:
+            try:
+                exporter.export(record)
+            except Exception:
+                pass
+
+    # ---------- exposition ----------
+    def render(self) -> str:
+        """
+        Render all metrics in the Prometheus text exposition format.
+        """
+        lines = []
+        with self._lock:
+            counters = sorted(self._counters.items())
+            gauges = sorted(self._gauges.items())
+            histograms = sorted(self._histograms.items(), key=lambda kv: kv[0])
+
+        seen = set()
+        for (name, key), value in counters:
+            if name not in seen:
+                lines.append(f"# TYPE {name} counter")
+                seen.add(name)
+            lines.append(f"{name}{_format_labels(key)} {value}")
+
+        for (name, key), value in gauges:
+            if name not in seen:
+                lines.append(f"# TYPE {name} gauge")
+                seen.add(name)
+            lines.append(f"{name}{_format_labels(key)} {value}")
+
+        for (name, key), (bucket_counts, total, count) in histograms:
+            if name not in seen:
+                lines.append(f"# TYPE {name} histogram")
+                seen.add(name)
+            for bound, bucket_count in zip(self.buckets, bucket_counts):
+                lines.append(f"{name}_bucket{_format_labels(key, {'le': bound})} {bucket_count}")
+            lines.append(f"{name}_bucket{_format_labels(key, {'le': '+Inf'})} {count}")
+            lines.append(f"{name}_sum{_format_labels(key)} {total}")
+            lines.append(f"{name}_count{_format_labels(key)} {count}")
+
+        return "\n".join(lines) + "\n"
+
+
+metrics = Metrics()
+
+if os.getenv("TRACE_EXPORT_FILE"):
+    metrics.exporters.append(FileSpanExporter(os.getenv("TRACE_EXPORT_FILE")))
+
+
+if __name__ == '__main__':
+    print('done')
@@ -0,0 +1,69 @@
+"""
+Move bot folders from the flat layout (bots_data/<bot_id>/,
+vector_store/<bot_id>/) to the sharded one
+(bots_data/<aa>/<bb>/<bot_id>/, same for vector_store).
+
+    python -m core.utils.migrate_layout --dry-run
+    python -m core.utils.migrate_layout
+
+Each bot is moved with a single rename, so the run is fast and can be
+resumed after an interruption. The layout marker is written first: while
+the migration runs, bots that were not moved yet are still found in their
+flat location. Stop the server (or pause ingestion) while migrating, so no
+upload writes into a folder that is being moved.
+"""
+import os
+import time
+import argparse
+
+from core.utils.handle_data import HandleData, is_shard_dir, shard_parts
+from core.utils.logger import get_logger
+
+logger = get_logger("migrate_layout")
+
+
+def flat_entries(root: str) -> list:
+    if not os.path.isdir(root):
+        return []
+    return sorted(
+        entry.name
+        for entry in os.scandir(root)
+        if entry.is_dir() and not entry.name.startswith(".") and not is_shard_dir(entry.name)
+    )
+
+
+def migrate(handle_data: HandleData, dry_run: bool = False) -> dict:
+    """
+    Move every flat bot folder (data and index) into its shard.
+    Returns counts of moved and skipped folders.
+    """
+    if not dry_run:
+        handle_data.write_layout("sharded")
+
+    moved = skipped = 0
+    start = time.perf_counter()
+    for root in (handle_data.BASE_DIR, handle_data.VECTOR_ROOT):
+        for bot_name in flat_entries(root):
+            source = os.path.join(root, bot_name)
+            target = os.path.join(root, *shard_parts(bot_name), bot_name)
+            if os.path.exists(target):
+                logger.warning("Skipping %s: %s already exists.", source, target)
+                skipped += 1
+                continue
+            if not dry_run:
+                os.makedirs(os.path.dirname(target), exist_ok=True)
+                os.rename(source, target)
+            moved += 1
+
+    return {"moved": moved, "skipped": skipped, "seconds": round(time.perf_counter() - start, 3), "dry_run": dry_run}
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Migrate bot folders to the sharded layout.")
+    parser.add_argument("--bots-data", default=None, help="Defaults to BOTS_DATA_DIR or bots_data.")
+    parser.add_argument("--vector-store", default=None, help="Defaults to VECTOR_STORE_DIR or vector_store.")
+    parser.add_argument("--dry-run", action="store_true", help="Only count the folders that would move.")
+    args = parser.parse_args()
+
+    result = migrate(HandleData(args.bots_data, args.vector_store), dry_run=args.dry_run)
+    print(result)
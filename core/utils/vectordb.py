@@ -1,23 +1,180 @@
 import os
+import json
+import math
+import uuid
 import pickle
-from typing import List
+import threading
+from typing import List, Optional
+import numpy as np
 from langchain_core.documents import Document
 from langchain.text_splitter import RecursiveCharacterTextSplitter
 from langchain_community.vectorstores import FAISS
+from langchain_community.docstore.in_memory import InMemoryDocstore
 from langchain_community.retrievers.bm25 import BM25Retriever
 from langchain.retrievers import EnsembleRetriever
 from langchain_huggingface import HuggingFaceEmbeddings
 from langchain_community.document_loaders import PyPDFLoader
+from core.utils.metrics import metrics
+from core.utils.logger import get_logger
+
+logger = get_logger("vectordb")
+
+EMBEDDING_MODEL_NAME = "sentence-transformers/all-MiniLM-L6-v2"
+
+# "auto" picks flat / hnsw / ivfpq from the number of chunks
+INDEX_TYPES = ("auto", "flat", "hnsw", "ivfpq")
+INDEX_FLAT_MAX_CHUNKS = int(os.getenv("INDEX_FLAT_MAX_CHUNKS", "5000"))
+INDEX_IVFPQ_MIN_CHUNKS = int(os.getenv("INDEX_IVFPQ_MIN_CHUNKS", "50000"))
+
+# "torch" (sentence-transformers default), "onnx" (fp32) or "onnx-int8"
+EMBEDDING_BACKENDS = ("torch", "onnx", "onnx-int8")
+EMBEDDING_ONNX_INT8_FILE = os.getenv("EMBEDDING_ONNX_INT8_FILE", "onnx/model_quint8_avx2.onnx")
+
+_embedding_models = {}
+_embedding_lock = threading.Lock()
+
+
+def get_embedding_model(backend: str = "torch") -> HuggingFaceEmbeddings:
+    """
+    Process-wide embedding model per backend. The ONNX backends need
+    `optimum[onnxruntime]`; if that is missing the torch model is used.
+    """
+    with _embedding_lock:
+        if backend in _embedding_models:
+            return _embedding_models[backend]
+
+        model_kwargs = {}
+        if backend == "onnx":
+            model_kwargs = {"backend": "onnx"}
+        elif backend == "onnx-int8":
+            model_kwargs = {"backend": "onnx", "model_kwargs": {"file_name": EMBEDDING_ONNX_INT8_FILE}}
+
+        try:
+            model = HuggingFaceEmbeddings(model_name=EMBEDDING_MODEL_NAME, model_kwargs=model_kwargs)
+        except Exception as e:
+            if backend == "torch":
+                raise
+            logger.warning("Embedding backend %s unavailable (%s); using torch.", backend, e)
+            model = _embedding_models.get("torch") or HuggingFaceEmbeddings(model_name=EMBEDDING_MODEL_NAME)
+            _embedding_models["torch"] = model
+            backend = "torch"
+
+        _embedding_models[backend] = model
+        return model
+
+
+def resolve_backend(backend: str) -> str:
+    """
+    The backend actually serving `backend` after any fallback, as recorded in index_config.json.
+    """
+    model = get_embedding_model(backend)
+    if backend != "torch" and model is _embedding_models.get("torch"):
+        return "torch"
+    return backend
+
+
+# Chunking and fusion defaults; `benchmarks.eval_retrieval` can tune them per bot
+DEFAULT_CHUNK_SIZE = 800
+DEFAULT_CHUNK_OVERLAP = 100
+DEFAULT_TOP_K = 5
+DEFAULT_WEIGHTS = [0.5, 0.5]  # [vector, bm25]
+
+
+def bot_retrieval_settings(config: Optional[dict]) -> dict:
+    """
+    Resolve index and retrieval settings from the `retrieval` block of a bot's meta.json:
+
+        "retrieval": {"index_type": "auto", "embedding_backend": "onnx-int8",
+                      "chunk_size": 800, "chunk_overlap": 100, "top_k": 5, "weights": [0.5, 0.5]}
+
+    Index settings fall back to INDEX_TYPE / EMBEDDING_BACKEND, then auto / torch.
+    """
+    settings = dict((config or {}).get("retrieval") or {})
+    return {
+        "index_type": settings.get("index_type") or os.getenv("INDEX_TYPE", "auto"),
+        "embedding_backend": settings.get("embedding_backend") or os.getenv("EMBEDDING_BACKEND", "torch"),
+        "chunk_size": int(settings.get("chunk_size", DEFAULT_CHUNK_SIZE)),
+        "chunk_overlap": int(settings.get("chunk_overlap", DEFAULT_CHUNK_OVERLAP)),
+        "top_k": int(settings.get("top_k", DEFAULT_TOP_K)),
+        "weights": [float(w) for w in settings.get("weights", DEFAULT_WEIGHTS)],
+    }
+
+
+# IVF-PQ needs enough vectors to train its coarse and product quantizers
+IVFPQ_MIN_TRAIN_CHUNKS = 1000
+
+
+def choose_index_type(num_chunks: int, index_type: str = "auto") -> str:
+    if index_type == "ivfpq" and num_chunks < IVFPQ_MIN_TRAIN_CHUNKS:
+        return "flat"
+    if index_type != "auto":
+        return index_type
+    if num_chunks <= INDEX_FLAT_MAX_CHUNKS:
+        return "flat"
+    if num_chunks < INDEX_IVFPQ_MIN_CHUNKS:
+        return "hnsw"
+    return "ivfpq"
+
+
+def build_faiss_index(vectors: np.ndarray, index_type: str):
+    """
+    Create and fill a raw faiss index of the given type.
+      - flat:  exact L2 search (the previous behaviour)
+      - hnsw:  graph index, sub-linear search, no training
+      - ivfpq: inverted lists + product quantization, ~16x smaller vectors
+    """
+    import faiss
+
+    num, dim = vectors.shape
+    if index_type == "flat":
+        index = faiss.IndexFlatL2(dim)
+    elif index_type == "hnsw":
+        index = faiss.IndexHNSWFlat(dim, 32)
+        index.hnsw.efConstruction = 80
+    elif index_type == "ivfpq":
+        nlist = max(1, min(int(4 * math.sqrt(num)), num // 39))
+        m = next(m for m in (dim // 8, 48, 32, 24, 16, 8, 4, 2, 1) if m and dim % m == 0)
+        nbits = 8 if num >= 256 * 39 else max(4, min(8, int(math.log2(max(16, num // 39)))))
+        quantizer = faiss.IndexFlatL2(dim)
+        index = faiss.IndexIVFPQ(quantizer, dim, nlist, m, nbits)
+        index.train(vectors)
+    else:
+        raise ValueError(f"Unknown index type '{index_type}'. Use one of {INDEX_TYPES}.")
+
+    index.add(vectors)
+    apply_search_params(index, index_type)
+    return index
+
+
+def apply_search_params(index, index_type: str):
+    """
+    Query-time accuracy/speed knobs (HNSW_EF_SEARCH, IVF_NPROBE).
+    """
+    if index_type == "hnsw":
+        index.hnsw.efSearch = int(os.getenv("HNSW_EF_SEARCH", "64"))
+    elif index_type == "ivfpq":
+        index.nprobe = min(index.nlist, int(os.getenv("IVF_NPROBE", "16")))
 
 
 class PDFIndexer:
-    def __init__(self):
+    def __init__(
+            self,
+            index_type: str = None,
+            embedding_backend: str = None,
+            chunk_size: int = DEFAULT_CHUNK_SIZE,
+            chunk_overlap: int = DEFAULT_CHUNK_OVERLAP,
+            weights: List[float] = None):
         self.pdf_path = None
         self.index_dir = None
+        self.index_type = index_type or os.getenv("INDEX_TYPE", "auto")
+        self.embedding_backend = embedding_backend or os.getenv("EMBEDDING_BACKEND", "torch")
+        self.chunk_size = chunk_size
+        self.chunk_overlap = chunk_overlap
+        self.weights = weights or DEFAULT_WEIGHTS
 
-        self.embedding_model = HuggingFaceEmbeddings(
-            model_name="sentence-transformers/all-MiniLM-L6-v2"
-        )
+    @property
+    def embedding_model(self) -> HuggingFaceEmbeddings:
+        return get_embedding_model(self.embedding_backend)
 
     def set_path(self , pdf_path , index_dir ):
         self.pdf_path = pdf_path
@@ -36,9 +193,43 @@ class PDFIndexer:
         if not split:
             return raw_docs
 
-        splitter = RecursiveCharacterTextSplitter(chunk_size=800, chunk_overlap=100)
+        splitter = RecursiveCharacterTextSplitter(chunk_size=self.chunk_size, chunk_overlap=self.chunk_overlap)
         return splitter.split_documents(raw_docs)
 
+    def build_vector_store(self, documents: List[Document], index_type: str = None):
+        """
+        Embed `documents` and wrap a faiss index of the chosen type in a LangChain FAISS store.
+        Returns (store, resolved_index_type).
+        """
+        index_type = choose_index_type(len(documents), index_type or self.index_type)
+        embedding = self.embedding_model
+
+        vectors = np.asarray(embedding.embed_documents([d.page_content for d in documents]), dtype="float32")
+        index = build_faiss_index(vectors, index_type)
+
+        ids = [str(uuid.uuid4()) for _ in documents]
+        store = FAISS(
+            embedding_function=embedding,
+            index=index,
+            docstore=InMemoryDocstore(dict(zip(ids, documents))),
+            index_to_docstore_id=dict(enumerate(ids)),
+        )
+        return store, index_type
+
+    def index_config_path(self, index_dir: str) -> str:
+        return os.path.join(index_dir, "index_config.json")
+
+    def load_index_config(self, index_dir: str) -> dict:
+        """
+        Settings an index was built with. Indexes built before this file
+        existed are flat, torch-embedded indexes.
+        """
+        path = self.index_config_path(index_dir)
+        if not os.path.exists(path):
+            return {"index_type": "flat", "embedding_backend": "torch"}
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+
     def build_and_save_indexes(self, split: bool = True):
         """
         Builds and saves FAISS and BM25 indexes for the PDF.
@@ -47,21 +238,32 @@ class PDFIndexer:
         bm25_path = os.path.join(self.index_dir, "bm25.pkl")
 
         if os.path.exists(faiss_path) and os.path.exists(bm25_path):
-            print("Indexes already exist. Skipping rebuild.")
+            logger.info("Indexes already exist in %s. Skipping rebuild.", self.index_dir)
             return
 
-        documents = self.extract_pdf_text(split=split)
+        with metrics.span("ingest:extract", index_dir=self.index_dir):
+            documents = self.extract_pdf_text(split=split)
 
         # Build FAISS
-        faiss_index = FAISS.from_documents(documents, self.embedding_model)
-        faiss_index.save_local(faiss_path)
+        with metrics.span("ingest:faiss", index_dir=self.index_dir, chunks=len(documents)) as span:
+            faiss_index, index_type = self.build_vector_store(documents)
+            faiss_index.save_local(faiss_path)
+            span.set(index_type=index_type, embedding_backend=self.embedding_backend)
+
+        with open(self.index_config_path(self.index_dir), "w", encoding="utf-8") as f:
+            json.dump({
+                "index_type": index_type,
+                "embedding_backend": resolve_backend(self.embedding_backend),
+                "chunks": len(documents),
+            }, f, indent=2)
 
         # Build BM25
-        bm25_index = BM25Retriever.from_documents(documents)
-        with open(bm25_path, "wb") as f:
-            pickle.dump(bm25_index, f)
+        with metrics.span("ingest:bm25", index_dir=self.index_dir, chunks=len(documents)):
+            bm25_index = BM25Retriever.from_documents(documents)
+            with open(bm25_path, "wb") as f:
+                pickle.dump(bm25_index, f)
 
-        print(f"Indexes built and saved to: {self.index_dir}")
+        logger.info("Indexes (%s) built and saved to: %s", index_type, self.index_dir)
 
     def load_hybrid_retriever(self , index_dir) -> EnsembleRetriever:
         """
@@ -70,18 +272,21 @@ class PDFIndexer:
         faiss_path = os.path.join(index_dir, "faiss")
         bm25_path = os.path.join(index_dir, "bm25.pkl")
 
+        # Queries must be embedded with the backend the index was built with
+        index_config = self.load_index_config(index_dir)
         faiss_index = FAISS.load_local(
             faiss_path,
-            embeddings=self.embedding_model,
+            embeddings=get_embedding_model(index_config.get("embedding_backend", "torch")),
             allow_dangerous_deserialization=True
         )
+        apply_search_params(faiss_index.index, index_config.get("index_type", "flat"))
 
         with open(bm25_path, "rb") as f:
             bm25_index = pickle.load(f)
 
         retriever = EnsembleRetriever(
             retrievers=[faiss_index.as_retriever(), bm25_index],
-            weights=[0.5, 0.5]  # Tune this if needed
+            weights=self.weights
         )
 
         return retriever
@@ -91,8 +296,11 @@ class PDFIndexer:
         Hybrid retrieval on the indexed PDF content.
         Returns a list of result dicts with content and metadata.
         """
-        retriever = self.load_hybrid_retriever(index_dir)
-        results: List[Document] = retriever.invoke(query, k=top_k)
+        with metrics.span("retrieval:load", index_dir=index_dir):
+            retriever = self.load_hybrid_retriever(index_dir)
+        with metrics.span("retrieval", index_dir=index_dir, top_k=top_k) as span:
+            results: List[Document] = retriever.invoke(query, k=top_k)
+            span.set(results=len(results))
 
         return [
             {
@@ -103,4 +311,4 @@ class PDFIndexer:
         ]
 
 if __name__ == '__main__':
-    print('done')
\ No newline at end of file
+    print('done')
@@ -1,22 +1,42 @@
-from fastapi import FastAPI, UploadFile, File, HTTPException , Form
+from fastapi import FastAPI, UploadFile, File, HTTPException , Form, Request, Response, Header, WebSocket, WebSocketDisconnect
 from pydantic import BaseModel
 import pandas as pd
 import os, json
 import uvicorn
-from typing import Optional
+import time
+import asyncio
+import anyio
+import threading
+from typing import Optional, List
 from langchain.schema import AIMessage
 from core import *
+from core.oai.callbacks import EventStreamCallbackHandler, TurnCancelled
 import uuid
 from fastapi.middleware.cors import CORSMiddleware
 import re
-from fastapi.responses import StreamingResponse
+from fastapi.responses import StreamingResponse, PlainTextResponse, JSONResponse
+from starlette.background import BackgroundTask
 import json
 
 
 app = FastAPI()
-BASE_DIR = "bots_data"
 processapi = ProcessApi()
 
+# Add `Server-Timing` headers to every response (or per request with `X-Timing: 1`)
+TIMING_HEADERS = os.getenv("TIMING_HEADERS", "0") == "1"
+
+# Items in flight across all /bots/chat/batch requests (items also share the chat pool below)
+BATCH_MAX_CONCURRENCY = int(os.getenv("BATCH_MAX_CONCURRENCY", "16"))
+batch_semaphore: Optional[asyncio.Semaphore] = None  # created inside the event loop
+BATCH_MAX_ITEMS = int(os.getenv("BATCH_MAX_ITEMS", "1000"))
+BULK_MAX_BOTS = int(os.getenv("BULK_MAX_BOTS", "5000"))
+
+# Admission control: separate worker pools for chat, streaming and ingestion
+admission = default_admission()
+
+# Retried chat requests with the same Idempotency-Key share one agent run
+idempotency = IdempotencyCache()
+
 
 # Allow all origins (NOT recommended for production)
 app.add_middleware(
@@ -25,17 +45,72 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],            # Allow all HTTP methods (GET, POST, etc.)
     allow_headers=["*"],            # Allow all headers (Authorization, Content-Type, etc.)
+    expose_headers=["Server-Timing", "X-Request-Id", "Idempotent-Replayed", "ETag"],
 )
 
+
+@app.exception_handler(Overloaded)
+async def overloaded_handler(request: Request, exc: Overloaded):
+    return JSONResponse(
+        status_code=429,
+        content={"detail": str(exc), "pool": exc.pool, "reason": exc.reason, "queue_depth": exc.queue_depth},
+        headers={"Retry-After": str(exc.retry_after)},
+    )
+
+
+@app.on_event("shutdown")
+async def close_llm_clients():
+    await processapi._process_text.client_pool.aclose()
+
+
+@app.middleware("http")
+async def trace_requests(request: Request, call_next):
+    trace = RequestTrace(request.headers.get("x-request-id"))
+    token = bind_trace(trace)
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+    finally:
+        unbind_trace(token)
+        route = request.scope.get("route")
+        metrics.observe(
+            "http_request_duration_seconds",
+            trace.elapsed(),
+            method=request.method,
+            path=getattr(route, "path", "unmatched"),
+            status=status,
+        )
+
+    response.headers["X-Request-Id"] = trace.trace_id
+    if TIMING_HEADERS or request.headers.get("x-timing") == "1":
+        response.headers["Server-Timing"] = trace.server_timing()
+    return response
+
  
 class BotInitRequest(BaseModel):
     bot_name: str
     greeting: str = "👋 Hello! I'm your assistant."
     api_key: Optional[str] = None
 
+class BulkBotRequest(BaseModel):
+    bots: List[BotInitRequest]
+
 class UserMessage(BaseModel):
     message: str
     bot_name: str
+    session_id: Optional[str] = None
+
+class BatchItem(BaseModel):
+    bot_name: str
+    message: str
+    session_id: Optional[str] = None
+    id: Optional[str] = None
+    idempotency_key: Optional[str] = None
+
+class BatchChatRequest(BaseModel):
+    items: List[BatchItem]
+    max_concurrency: Optional[int] = None
 
 
 def slugify(text: str) -> str:
@@ -43,18 +118,83 @@ def slugify(text: str) -> str:
     return re.sub(r'[^a-zA-Z0-9_-]', '-', text.strip().lower())
 
 
+def load_bot_config(bot_name: str) -> dict:
+    config_path = processapi._handle_data.get_meta_path(bot_name)
+    schedule_path = processapi._handle_data.get_schedule_path(bot_name)
+
+    if not os.path.exists(config_path) or not os.path.exists(schedule_path):
+        raise HTTPException(status_code=404, detail="Bot configuration or schedule not found.")
+
+    # Load prompt & initial message
+    with open(config_path, "r" , encoding="utf-8") as f:
+        return json.load(f)
+
+
+def run_chat(bot_name: str, message: str, session_id: Optional[str], config: dict, idempotency_key: Optional[str] = None):
+    """
+    Run one chat turn, deduplicated by `idempotency_key` when given.
+    Returns (bot_reply, status) where status is "miss", "inflight" or "cached".
+    """
+    def run():
+        return processapi._process_text.process(
+            bot_name, message, config.get("system_prompt"), config.get("api_key"), config, session_id
+        )
+
+    if not idempotency_key:
+        return run(), "miss"
+
+    key = f"{session_key(bot_name, session_id)}:{idempotency_key}"
+    try:
+        return idempotency.run(key, fingerprint(message), run)
+    except IdempotencyConflict as e:
+        raise HTTPException(status_code=422, detail=str(e))
+
+
 @app.get('/')
 def index():
     return {"message" : "Hare Krishna"}
 
 
+@app.get("/metrics")
+def get_metrics():
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+
+def new_bot_id(bot_name: str) -> str:
+    # Create a unique ID
+    safe_name = slugify(bot_name)
+    unique_id = str(uuid.uuid4())[:8]   # short UUID for uniqueness
+    return f"{safe_name}-{unique_id}"
+
+
+def new_bot_meta(bot_data: BotInitRequest, bot_id: str) -> dict:
+    final_prompt = BASE_SYSTEM_PROMPT.strip()
+    return {
+        "greeting": bot_data.greeting,
+        "system_prompt": final_prompt,
+        "api_key": bot_data.api_key,
+        "bot_name": bot_data.bot_name,
+        "bot_id": bot_id,
+        "models": {
+            "fast": DEFAULT_MODELS[FAST],
+            "strong": DEFAULT_MODELS[STRONG],
+            "routing": "auto"
+        },
+        "prompt": {
+            "compact": True,
+            "tool_selection": True
+        },
+        "retrieval": {
+            "index_type": "auto",
+            "embedding_backend": "torch"
+        }
+    }
+
+
 @app.post("/bots/create")
 def create_bot(bot_data: BotInitRequest):
     try:
-        # Create a unique ID
-        safe_name = slugify(bot_data.bot_name)
-        unique_id = str(uuid.uuid4())[:8]   # short UUID for uniqueness
-        bot_id = f"{safe_name}-{unique_id}"
+        bot_id = new_bot_id(bot_data.bot_name)
 
         # Folder for this bot
         folder = processapi._handle_data.get_bot_folder(bot_id)
@@ -62,16 +202,10 @@ def create_bot(bot_data: BotInitRequest):
         if os.path.exists(folder):
             raise HTTPException(status_code=400, detail="Bot already exists.")
 
-        final_prompt = BASE_SYSTEM_PROMPT.strip()
-        meta = {
-            "greeting": bot_data.greeting,
-            "system_prompt": final_prompt,
-            "api_key": bot_data.api_key,
-            "bot_name": bot_data.bot_name,
-            "bot_id": bot_id
-        }
+        meta = new_bot_meta(bot_data, bot_id)
 
         processapi._handle_data.savejson(bot_id, meta)
+        metrics.inc("bots_created_total")
 
         return {"message": bot_data.bot_name, "bot_id": bot_id}
 
@@ -79,12 +213,49 @@ def create_bot(bot_data: BotInitRequest):
         raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
+
+
+@app.post("/bots/create/batch")
+def create_bots(batch: BulkBotRequest):
+    """
+    Provision many bots at once. Either every bot is created or none is.
+    """
+    if not batch.bots:
+        raise HTTPException(status_code=400, detail="No bots given.")
+    if len(batch.bots) > BULK_MAX_BOTS:
+        raise HTTPException(status_code=413, detail=f"At most {BULK_MAX_BOTS} bots per request.")
+    if any(not bot.bot_name.strip() for bot in batch.bots):
+        raise HTTPException(status_code=400, detail="Every bot needs a bot_name.")
+
+    try:
+        metas = {}
+        for bot_data in batch.bots:
+            bot_id = new_bot_id(bot_data.bot_name)
+            metas[bot_id] = new_bot_meta(bot_data, bot_id)
+
+        with metrics.span("bots:create_batch", bots=len(metas)):
+            processapi._handle_data.create_bots(metas)
+        metrics.inc("bots_created_total", len(metas))
+
+        return {
+            "created": len(metas),
+            "bots": [{"message": meta["bot_name"], "bot_id": bot_id} for bot_id, meta in metas.items()],
+        }
+
+    except FileExistsError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
     
 @app.post("/bots/upload_schedule")
-def upload_schedule(
+async def upload_schedule(
     bot_name: str = Form(...),
     file: UploadFile = File(...)
 ):
+    return await admission["ingest"].run(bot_name, _upload_schedule, bot_name, file)
+
+
+def _upload_schedule(bot_name: str, file: UploadFile):
     try:
         folder = processapi._handle_data.get_bot_folder(bot_name)
         if not os.path.exists(folder):
@@ -95,7 +266,11 @@ def upload_schedule(
         if not expected_cols.issubset(df.columns):
             raise HTTPException(status_code=400, detail=f"CSV must contain: {expected_cols}")
 
-        df.to_csv(processapi._handle_data.get_schedule_path(bot_name), index=False)
+        schedule_path = processapi._handle_data.get_schedule_path(bot_name)
+        df.to_csv(schedule_path, index=False)
+        # Holds point at rows of the old schedule
+        slot_holds.release_bot(bot_name)
+        availability.rebuild(bot_name, df, schedule_path)
         return {"message": f"Schedule updated for bot '{bot_name}'."}
 
     except HTTPException:
@@ -106,22 +281,26 @@ def upload_schedule(
 
 
 @app.post("/bots/upload_context_pdf")
-def upload_context_pdf(
+async def upload_context_pdf(
     bot_name: str = Form(...),
     file: UploadFile = File(...)
 ):
+    return await admission["ingest"].run(bot_name, _upload_context_pdf, bot_name, file)
+
+
+def _upload_context_pdf(bot_name: str, file: UploadFile):
     try:
         folder = processapi._handle_data.get_bot_folder(bot_name)
         if not os.path.exists(folder):
             raise HTTPException(status_code=404, detail="Bot does not exist.")
 
-        pdf_path = os.path.join(folder, "context.pdf")
-        with open(pdf_path, "wb") as f:
-            f.write(file.file.read())
+        with open(processapi._handle_data.get_meta_path(bot_name), "r", encoding="utf-8") as f:
+            config = json.load(f)
 
-        res = processapi.create_bot(bot_name, pdf_path, True)
+        # Adds the PDF to the bot's knowledge base alongside earlier documents
+        document = processapi.add_document(bot_name, file.filename or "context.pdf", file.file.read(), config=config)
 
-        return {"message": f"Context PDF uploaded for bot '{bot_name}'."}
+        return {"message": f"Context PDF uploaded for bot '{bot_name}'.", "document": document}
 
     except HTTPException:
         raise
@@ -129,9 +308,69 @@ def upload_context_pdf(
         raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
 
 
+@app.post("/bots/{bot_name}/documents")
+async def add_document(bot_name: str, file: UploadFile = File(...)):
+    return await admission["ingest"].run(bot_name, _upload_context_pdf, bot_name, file)
+
+
+@app.get("/bots/{bot_name}/documents")
+def list_documents(bot_name: str):
+    if not os.path.exists(processapi._handle_data.get_bot_folder(bot_name)):
+        raise HTTPException(status_code=404, detail="Bot does not exist.")
+    return {"documents": processapi.list_documents(bot_name)}
+
+
+@app.delete("/bots/{bot_name}/documents/{doc_id}")
+async def delete_document(bot_name: str, doc_id: str):
+    return await admission["ingest"].run(bot_name, _delete_document, bot_name, doc_id)
+
+
+def _delete_document(bot_name: str, doc_id: str):
+    try:
+        processapi.delete_document(bot_name, doc_id)
+        return {"message": f"Document '{doc_id}' deleted from bot '{bot_name}'."}
+
+    except DocumentNotFound as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
+
+
+
+@app.get("/bots/{bot_name}/availability")
+def get_availability(bot_name: str, request: Request, month: Optional[str] = None):
+    """
+    Free and total slots per day for one month (YYYY-MM, default: current).
+    Answers 304 when `If-None-Match` carries the month's current ETag.
+    """
+    month = month or time.strftime("%Y-%m")
+    if not re.fullmatch(r"\d{4}-\d{2}", month):
+        raise HTTPException(status_code=400, detail="month must be formatted as YYYY-MM.")
+
+    schedule_path = processapi._handle_data.get_schedule_path(bot_name)
+    if not os.path.exists(schedule_path):
+        raise HTTPException(status_code=404, detail="Bot does not exist.")
+
+    days = availability.month(bot_name, month, schedule_path)
+    etag = availability.etag(bot_name, month, days)
+    # Cacheable, but revalidated on every use so bookings show up immediately
+    headers = {"ETag": etag, "Cache-Control": "public, no-cache"}
+
+    if_none_match = request.headers.get("if-none-match", "")
+    candidates = {tag.strip().removeprefix("W/") for tag in if_none_match.split(",")}
+    if etag in candidates or "*" in candidates:
+        metrics.inc("availability_requests_total", result="not_modified")
+        return Response(status_code=304, headers=headers)
+
+    metrics.inc("availability_requests_total", result="ok")
+    return JSONResponse(
+        content={"bot_name": bot_name, "month": month, "days": days},
+        headers=headers,
+    )
+
 
 @app.get("/bots/{bot_name}/start")
-def start_bot(bot_name: str):
+def start_bot(bot_name: str, session_id: Optional[str] = None):
     try:
         meta_path = processapi._handle_data.get_meta_path(bot_name)
         if not os.path.exists(meta_path):
@@ -147,8 +386,8 @@ def start_bot(bot_name: str):
             raise HTTPException(status_code=500, detail="No API key provided or found in environment.")
 
         # Initialize agent and inject greeting into memory
-        agent = processapi._process_text.get_or_create_agent(bot_name, system_prompt, api_key)
-        memory = processapi._process_text.memories[bot_name]
+        agent = processapi._process_text.get_or_create_agent(bot_name, system_prompt, api_key, meta, session_id=session_id)
+        memory = processapi._process_text.memories[session_key(bot_name, session_id)]
         memory.chat_memory.messages = [AIMessage(content=greeting)]
 
         return {"message": greeting}
@@ -159,20 +398,25 @@ def start_bot(bot_name: str):
         raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
 
 @app.post("/bots/chat")
-def chat_with_bot(user_message: UserMessage):
-    try:
-        folder_path = os.path.join(BASE_DIR, user_message.bot_name)
-        config_path = os.path.join(folder_path, "meta.json")
-        schedule_path = os.path.join(folder_path, "schedule.csv")
+async def chat_with_bot(
+    user_message: UserMessage,
+    response_headers: Response,
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key")
+):
+    return await admission["chat"].run(
+        user_message.bot_name, _chat_with_bot, user_message, response_headers, idempotency_key
+    )
 
-        if not os.path.exists(config_path) or not os.path.exists(schedule_path):
-            raise HTTPException(status_code=404, detail="Bot configuration or schedule not found.")
 
-        # Load prompt & initial message
-        with open(config_path, "r" , encoding="utf-8") as f:
-            config = json.load(f)
+def _chat_with_bot(user_message: UserMessage, response_headers: Response, idempotency_key: Optional[str]):
+    try:
+        config = load_bot_config(user_message.bot_name)
 
-        response = processapi._process_text.process(user_message.bot_name,user_message.message , config.get('system_prompt') ,  config.get('api_key'))
+        response, status = run_chat(
+            user_message.bot_name, user_message.message, user_message.session_id, config, idempotency_key
+        )
+        if status != "miss":
+            response_headers.headers["Idempotent-Replayed"] = "true"
 
         return {
             "bot_reply": response
@@ -186,18 +430,38 @@ def chat_with_bot(user_message: UserMessage):
 
 
 @app.post("/bots/stream")
-def chat_with_bot_stream(user_message: UserMessage):
+async def chat_with_bot_stream(user_message: UserMessage):
+    # The slot is held for the whole stream and released when it ends, either
+    # by the body's cleanup or by the background task after a disconnect.
+    pool = admission["stream"]
+    ticket = await pool.acquire(user_message.bot_name)
     try:
-        folder_path = os.path.join(BASE_DIR, user_message.bot_name)
-        config_path = os.path.join(folder_path, "meta.json")
-        schedule_path = os.path.join(folder_path, "schedule.csv")
+        event_stream = await anyio.to_thread.run_sync(_chat_with_bot_stream, user_message, limiter=pool.limiter)
+    except BaseException:
+        ticket.release()
+        raise
 
-        if not os.path.exists(config_path) or not os.path.exists(schedule_path):
-            raise HTTPException(status_code=404, detail="Bot configuration or schedule not found.")
+    async def limited_stream():
+        try:
+            while True:
+                chunk = await anyio.to_thread.run_sync(next, event_stream, None, limiter=pool.limiter)
+                if chunk is None:
+                    break
+                yield chunk
+        finally:
+            ticket.release()
 
-        # Load prompt & initial message
-        with open(config_path, "r", encoding="utf-8") as f:
-            config = json.load(f)
+    # Async so Starlette runs it on the event loop, not in its threadpool:
+    # the pool's semaphores and counters are only touched from the loop.
+    async def release():
+        ticket.release()
+
+    return StreamingResponse(limited_stream(), media_type="text/event-stream", background=BackgroundTask(release))
+
+
+def _chat_with_bot_stream(user_message: UserMessage):
+    try:
+        config = load_bot_config(user_message.bot_name)
 
         def event_stream():
             try:
@@ -205,10 +469,16 @@ def chat_with_bot_stream(user_message: UserMessage):
                     user_message.bot_name,
                     user_message.message,
                     config.get("system_prompt"),
-                    config.get("api_key")
+                    config.get("api_key"),
+                    config,
+                    user_message.session_id
                 ):
+                    # The fast model failed and the strong model replays the turn
+                    if "escalated" in step:
+                        yield f"data: {json.dumps({'type': 'escalated', 'discard_previous_steps': True, **step['escalated']})}\n\n"
+
                     # Final Output
-                    if "output" in step:
+                    elif "output" in step:
                         yield f"data: {json.dumps({'type': 'final', 'output': step['output']})}\n\n"
 
                     # Intermediate Reasoning + Tool Use
@@ -236,7 +506,7 @@ def chat_with_bot_stream(user_message: UserMessage):
 
 
 
-        return StreamingResponse(event_stream(), media_type="text/event-stream")
+        return event_stream()
 
     except HTTPException:
         raise
@@ -245,5 +515,153 @@ def chat_with_bot_stream(user_message: UserMessage):
 
 
 
+@app.websocket("/bots/ws/{bot_name}")
+async def chat_with_bot_ws(websocket: WebSocket, bot_name: str, session_id: Optional[str] = None):
+    """
+    Persistent chat transport: one connection is one bot session. The bot's
+    config is resolved once at connect time.
+
+    Client -> server: {"type": "message", "message": "..."} or {"type": "cancel"}
+    Server -> client: "ready", "token", "tool_start", "tool_end", "escalated",
+                      "final", "cancelled" and "error" events.
+    """
+    await websocket.accept()
+    try:
+        config = await anyio.to_thread.run_sync(load_bot_config, bot_name)
+    except HTTPException as e:
+        await websocket.send_json({"type": "error", "error": e.detail})
+        await websocket.close(code=4404)
+        return
+
+    loop = asyncio.get_running_loop()
+    outbound = asyncio.Queue()
+    current = {"task": None, "cancel": None}
+
+    def emit(event: dict):
+        # Called from the agent's worker thread
+        loop.call_soon_threadsafe(outbound.put_nowait, event)
+
+    async def sender():
+        while True:
+            await websocket.send_json(await outbound.get())
+
+    async def run_turn(message: str, cancel: threading.Event):
+        handler = EventStreamCallbackHandler(emit, cancel)
+        try:
+            reply = await admission["stream"].run(
+                bot_name,
+                lambda: processapi._process_text.process(
+                    bot_name, message, config.get("system_prompt"), config.get("api_key"), config,
+                    session_id, callbacks=[handler], streaming=True,
+                ),
+            )
+            await outbound.put({"type": "final", "output": reply})
+        except Overloaded as e:
+            await outbound.put({"type": "error", "error": str(e), "retry_after": e.retry_after})
+        except TurnCancelled:
+            await outbound.put({"type": "cancelled"})
+        except Exception as e:
+            await outbound.put({"type": "error", "error": str(e)})
+
+    send_task = asyncio.create_task(sender())
+    await outbound.put({"type": "ready", "bot_name": bot_name, "session_id": session_id})
+    metrics.add_gauge("websocket_connections", 1)
+    try:
+        while True:
+            try:
+                data = await websocket.receive_json()
+            except ValueError:
+                await outbound.put({"type": "error", "error": "Invalid JSON."})
+                continue
+            if not isinstance(data, dict):
+                data = {"message": str(data)}
+            kind = data.get("type", "message")
+            busy = current["task"] is not None and not current["task"].done()
+
+            if kind == "cancel":
+                if busy:
+                    current["cancel"].set()
+            elif kind == "message":
+                if busy:
+                    await outbound.put({"type": "error", "error": "A turn is already in progress."})
+                    continue
+                current["cancel"] = threading.Event()
+                current["task"] = asyncio.create_task(run_turn(str(data.get("message", "")), current["cancel"]))
+            else:
+                await outbound.put({"type": "error", "error": f"Unknown event type '{kind}'."})
+
+    except WebSocketDisconnect:
+        pass
+    finally:
+        metrics.add_gauge("websocket_connections", -1)
+        if current["cancel"] is not None:
+            current["cancel"].set()
+        send_task.cancel()
+
+
+@app.post("/bots/chat/batch")
+async def chat_with_bot_batch(batch: BatchChatRequest):
+    """
+    Run many chat messages concurrently and stream one NDJSON line per item as
+    it completes. Items of the same conversation (bot + session_id) run in
+    request order; everything else runs in parallel, bounded by the
+    request's `max_concurrency` and by BATCH_MAX_CONCURRENCY across all
+    batch requests.
+    """
+    global batch_semaphore
+    if len(batch.items) > BATCH_MAX_ITEMS:
+        raise HTTPException(status_code=413, detail=f"Batch too large: at most {BATCH_MAX_ITEMS} items.")
+    if batch_semaphore is None:
+        batch_semaphore = asyncio.Semaphore(BATCH_MAX_CONCURRENCY)
+
+    concurrency = min(batch.max_concurrency or BATCH_MAX_CONCURRENCY, BATCH_MAX_CONCURRENCY)
+    semaphore = asyncio.Semaphore(max(1, concurrency))
+    results = asyncio.Queue()
+    configs = {}
+
+    conversations = {}
+    for index, item in enumerate(batch.items):
+        conversations.setdefault(session_key(item.bot_name, item.session_id), []).append((index, item))
+
+    def run_item(index: int, item: BatchItem) -> dict:
+        start = time.perf_counter()
+        result = {"index": index, "id": item.id, "bot_name": item.bot_name, "session_id": item.session_id}
+        try:
+            if item.bot_name not in configs:
+                configs[item.bot_name] = load_bot_config(item.bot_name)
+            config = configs[item.bot_name]
+            result["bot_reply"], dedup = run_chat(
+                item.bot_name, item.message, item.session_id, config, item.idempotency_key
+            )
+            result["status"] = "ok"
+            result["replayed"] = dedup != "miss"
+        except HTTPException as e:
+            result.update(status="error", error=e.detail)
+        except Exception as e:
+            result.update(status="error", error=f"Internal server error: {str(e)}")
+        result["elapsed_ms"] = round((time.perf_counter() - start) * 1000, 1)
+        metrics.inc("batch_items_total", status=result["status"])
+        return result
+
+    async def run_conversation(items):
+        for index, item in items:
+            async with semaphore, batch_semaphore:
+                # Batch items wait for the chat pool instead of being rejected
+                result = await admission["chat"].run(item.bot_name, run_item, index, item, reject=False)
+            await results.put(result)
+
+    async def ndjson_stream():
+        tasks = [asyncio.create_task(run_conversation(items)) for items in conversations.values()]
+        try:
+            for _ in range(len(batch.items)):
+                yield json.dumps(await results.get()) + "\n"
+        finally:
+            # Client went away: stop scheduling the remaining items
+            for task in tasks:
+                task.cancel()
+
+    return StreamingResponse(ndjson_stream(), media_type="application/x-ndjson")
+
+
 if __name__ == "__main__":
     uvicorn.run("main:app", port=8838,host='0.0.0.0' , reload=True)